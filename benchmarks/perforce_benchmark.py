@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+    Perforce helpers benchmark suite.
+
+Spin up a throwaway local p4d, seed it with generated files, time the
+public qui.vcs.perforce helpers and AssetTreeWidget.update_perforce_infos
+and store the results as a machine readable json baseline.
+
+Usage
+```
+python benchmarks/perforce_benchmark.py --sizes 1000 10000 --output baseline.json
+python benchmarks/perforce_benchmark.py --sizes 1000 10000 --compare baseline.json
+```
+`p4d` must be in the PATH (or given with --p4d).
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qui.vcs import perforce
+from qui.vcs.perforce import server, stats
+
+files_per_directory = 100
+per_file_sample = 1000  # number of files used by the per-file loops
+pending_changelist_count = 10
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+class LocalServer(object):
+    """
+    Throwaway p4d seeded with `size` files in a `bench` client.
+    """
+
+    def __init__(self, p4d, size):
+        self.size = size
+        self.directory = tempfile.mkdtemp(prefix="qui_p4_bench_")
+        self.root = os.path.join(self.directory, "root")
+        self.workspace = os.path.join(self.directory, "ws")
+        os.makedirs(self.root)
+        os.makedirs(self.workspace)
+        self.port = "localhost:{}".format(free_port())
+        self.process = subprocess.Popen(
+            [p4d, '-r', self.root, '-p', self.port, '-L', 'log', '-J', 'off'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        os.environ.pop('P4CONFIG', None)
+        os.environ.update({
+            'P4PORT': self.port,
+            'P4USER': 'bench',
+            'P4CLIENT': 'bench',
+        })
+        self._wait_for_server()
+        self.filenames = []
+        self._seed()
+
+    def _wait_for_server(self, timeout=30.0):
+        limit = time.monotonic() + timeout
+        while True:
+            try:
+                with server.connect() as p4:
+                    p4.run('info')
+                    return
+
+            except perforce.P4Exception:
+                if time.monotonic() > limit:
+                    raise
+
+                time.sleep(0.2)
+
+    def _seed(self):
+        for i in range(self.size):
+            directory = os.path.join(
+                self.workspace, "dir{:04d}".format(i // files_per_directory)
+            )
+            if i % files_per_directory == 0:
+                os.makedirs(directory)
+
+            filename = os.path.join(directory, "asset{:06d}.ma".format(i))
+            with open(filename, 'w') as f:
+                f.write(filename)
+
+            self.filenames.append(filename)
+
+        with server.connect() as p4:
+            client = p4.fetch_client('bench')
+            client['Root'] = self.workspace
+            client['View'] = ['//depot/... //bench/...']
+            p4.save_client(client)
+            perforce.run_batched(p4, 'add', self.filenames)
+            p4.run('submit', '-d', 'Seed {} files'.format(self.size))
+            for i in range(pending_changelist_count):
+                change = p4.fetch_change()
+                change['Description'] = "Pending {}".format(i)
+                change['Files'] = []
+                p4.save_change(change)
+
+            p4.run('edit', self.filenames[:per_file_sample // 10])
+
+    def close(self):
+        server.pool.clear()
+        self.process.terminate()
+        self.process.wait()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def measure(func):
+    """
+    Return a dict with the wall clock time and the server round trips
+    of `func()` run with cold caches and a warm connection pool.
+    """
+    perforce.invalidate_caches()
+    stats.registry.reset()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    commands = stats.registry.snapshot()['commands']
+    return {
+        'seconds': seconds,
+        'round_trips': sum(c['count'] for c in commands.values()),
+        'commands': {k: c['count'] for k, c in commands.items()},
+    }
+
+
+def asset_tree_benchmark(filenames):
+    """
+    Return a function populating an AssetTreeWidget with `filenames` and
+    timing its update_perforce_infos.
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6 import QtCore
+    from PySide6.QtWidgets import QApplication
+    from qui.ui.widget import AssetTreeWidget
+
+    class Filter(QtCore.QObject):
+        filterChanged = QtCore.Signal()
+        filter_str = ''
+        extensions = None
+
+    app = QApplication.instance() or QApplication([])
+    filter_widget = Filter()
+    widget = AssetTreeWidget(filter_widget, lambda: [
+        {'clientFile': f, 'basename': os.path.basename(f)} for f in filenames
+    ])
+    widget.populate()
+    app.processEvents()
+    return widget.update_perforce_infos
+
+
+def run_benchmarks(local_server, with_widget=True):
+    filenames = local_server.filenames
+    sample = filenames[:per_file_sample]
+    depot_paths = [
+        "//depot/{}".format(os.path.relpath(f, local_server.workspace).replace(os.path.sep, '/'))
+        for f in filenames
+    ]
+    benchmarks = {
+        'get_depot_path_per_file': lambda: [perforce.get_depot_path(f) for f in sample],
+        'get_depot_paths': lambda: perforce.get_depot_paths(filenames),
+        'get_local_path_per_file': lambda: [
+            perforce.get_local_path(f) for f in depot_paths[:per_file_sample]
+        ],
+        'get_local_paths': lambda: perforce.get_local_paths(depot_paths),
+        'filter_perforced_filenames': lambda: perforce.filter_perforced_filenames(filenames),
+        'resolve_local_path_with_revision_per_file': lambda: [
+            perforce.resolve_local_path_with_revision(f) for f in sample
+        ],
+        'resolve_local_paths_with_revision': lambda: (
+            perforce.resolve_local_paths_with_revision(filenames)
+        ),
+        'pending_changelists': perforce.get_current_user_pending_changelists,
+        'pending_changelist_numbers': perforce.get_current_user_pending_changelists_numbers,
+        'fstat_parallel': lambda: perforce.fstat_parallel(filenames),
+    }
+    if with_widget is True:
+        benchmarks['asset_tree_update_perforce_infos'] = asset_tree_benchmark(filenames)
+
+    return {name: measure(func) for name, func in benchmarks.items()}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the list of regression messages of `results` against `baseline`.
+    """
+    regressions = []
+    for size, benchmarks in results.items():
+        for name, r in benchmarks.items():
+            b = baseline.get('results', {}).get(size, {}).get(name)
+            if b is None:
+                continue
+
+            if r['round_trips'] > b['round_trips']:
+                regressions.append("{} ({} files): {} round trips instead of {}".format(
+                    name, size, r['round_trips'], b['round_trips']
+                ))
+
+            if r['seconds'] > b['seconds'] * (1.0 + tolerance):
+                regressions.append("{} ({} files): {:.3f}s instead of {:.3f}s".format(
+                    name, size, r['seconds'], b['seconds']
+                ))
+
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1].strip())
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--p4d', default=shutil.which('p4d'))
+    parser.add_argument('--output', help="json file to write the results into")
+    parser.add_argument('--compare', help="baseline json file to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed relative slowdown against the baseline")
+    parser.add_argument('--no-widget', action='store_true',
+                        help="skip the AssetTreeWidget benchmark")
+    args = parser.parse_args(argv[1:])
+    if args.p4d is None:
+        print("ERR - p4d executable not found.")
+        return 2
+
+    stats.enabled = True
+    results = {}
+    for size in args.sizes:
+        print("Benchmarking {} files ...".format(size))
+        local_server = LocalServer(args.p4d, size)
+        try:
+            results[str(size)] = run_benchmarks(
+                local_server, with_widget=args.no_widget is False
+            )
+
+        finally:
+            local_server.close()
+
+        for name, r in results[str(size)].items():
+            print("    {:<45} {:>9.3f}s {:>7} round trips".format(
+                name, r['seconds'], r['round_trips']
+            ))
+
+    data = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=4, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+        for r in regressions:
+            print("REGRESSION - {}".format(r))
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -14,38 +14,33 @@ from PySide6.QtWidgets import (
     QTreeWidgetItem,
 )
 
-from datetime import datetime, timedelta
 from qui.ui.button import QuickButton
 from qui import icon_provider
 from qui.vcs import perforce
+from qui.vcs.perforce import (
+    index,
+    sync_queue,
+)
+
 
-__client_root = None
-__last_call_datetime = None
-def remove_client_root_from_filename(filename):
+def remove_client_root_from_filename(filename, client_root=None):
     """
     Return `filename` without the path part corresponding to the current user
     client root returned by the command 'p4 info'.
-    Note 'p4 info' command is cached for 10 sec.
+    Note 'p4 info' command is cached by the connection session snapshot.
+    `client_root` can be given to avoid checking out a connection when
+    called for many files.
     """
-    global __client_root, __last_call_datetime
-
     realpath = os.path.realpath(filename)
-    if __client_root is not None:
-        if (datetime.now() - __last_call_datetime) > timedelta(seconds=10):
-            __client_root = None
-
-    if __client_root is None:
+    if client_root is None:
         with perforce.server.connect() as p4:
-            res = p4.run('info')[0]
-            __client_root = os.path.realpath(res['clientRoot'])
+            client_root = p4.snapshot.client_root
 
-    __last_call_datetime = datetime.now()
     offset = (
-        0 if __client_root.endswith('/') or __client_root.endswith('\\')
+        0 if client_root.endswith('/') or client_root.endswith('\\')
         else 1
     )
-    return "{}".format(realpath[len(__client_root) + offset:])
-
+    return "{}".format(realpath[len(client_root) + offset:])
 
 
 class AssetTreeFilterMixin(object):
@@ -70,6 +65,11 @@ class AssetTreeWidget(QTreeWidget):
                 parent=parent, f=f
             )
             self.keys = []
+            self.tree_widget = parent
+            # Latest perforce.FileStat record and the other values, kept as
+            # python objects instead of Qt dynamic properties to save memory.
+            self._record = None
+            self._properties = {}
             self.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Fixed)
             layout = QHBoxLayout()
             layout.setContentsMargins(0, 0, 3, 0)
@@ -144,32 +144,41 @@ class AssetTreeWidget(QTreeWidget):
             self.button.style().polish(self.button)
 
         def clickedSlot(self):
-            with perforce.server.connect() as p4:
-                filename = self.property(str('clientFile'))
-                print("Updating {} ...".format(repr(filename)))
-                res = p4.run('sync', '-f', filename)
-                if res != []:
-                    res = p4.run('fstat', filename)
-                    try:
-                        self.property_dict = res[0]
-
-                    except KeyError:
-                        print("WRN - Some expected keys are missing.", repr(res[0]))
+            # Sync the whole selection if the clicked row is part of it.
+            filename = self.property(str('clientFile'))
+            filenames = self.tree_widget.selected_client_files()
+            if filename not in filenames:
+                filenames = [filename]
 
-                print("Done.")
+            self.tree_widget.sync_files(filenames)
 
         @property
         def property_dict(self):
-            d = {}.fromkeys(self.keys)
-            for k in d:
-                d[k] = self.property(str(k))
+            d = {}
+            for k in self.keys:
+                if k in self._properties:
+                    d[k] = self._properties[k]
+
+                elif self._record is not None and k in self._record:
+                    d[k] = self._record[k]
 
             return d
 
         @property_dict.setter
         def property_dict(self, property_dict):
+            if isinstance(property_dict, perforce.FileStat):
+                # The new record replaces the values of the previous one.
+                self._record = property_dict
+                for k in property_dict:
+                    self._properties.pop(k, None)
+
+            else:
+                self._properties.update(property_dict)
+
+            if 'clientFile' in property_dict:
+                self.setProperty(str('clientFile'), property_dict['clientFile'])
+
             for k in property_dict:
-                self.setProperty(str(k), property_dict[k])
                 if k not in self.keys:
                     self.keys.append(k)
 
@@ -201,6 +210,12 @@ class AssetTreeWidget(QTreeWidget):
         self.setColumnCount(2)
         self.setHeaderLabels(['Asset Name', 'Directory'])
         self.sortByColumn(1, Qt.AscendingOrder)
+        # Files are synced from a worker thread and their rows updated
+        # when each batch is done.
+        self.sync_queue = sync_queue.SyncQueue(parent=self)
+        self.sync_queue.batchFinished.connect(self.syncBatchFinishedSlot)
+        # Case insensitive index.path_key of the rows files: QTreeWidgetItem
+        self._items = {}
 
     @property
     def current_item_property_dict(self):
@@ -233,16 +248,21 @@ class AssetTreeWidget(QTreeWidget):
 
     def populate(self):
         self.clear()
+        self._items = {}
         try:
             self.setSortingEnabled(False)
             self.hide()
+            # Read once instead of checking out a connection for each row.
+            with perforce.server.connect() as p4:
+                client_root = p4.snapshot.client_root
+
             for a in self.get_asset_list():
                 item = QTreeWidgetItem()
                 item.setText(0, a['basename'])
                 item.setText(
                     1,
-                    utils.path.remove_client_root_from_filename(
-                        os.path.dirname(a['clientFile'])
+                    remove_client_root_from_filename(
+                        os.path.dirname(a['clientFile']), client_root
                     ).replace("\\", " ")
                 )
                 item.setIcon(1, icon_provider.get('empty.svg'))
@@ -253,6 +273,9 @@ class AssetTreeWidget(QTreeWidget):
                 w.property_dict = a
                 self.addTopLevelItem(item)
                 self.setItemWidget(item, 1, w)
+                self._items[
+                    index.path_key(a['clientFile'], case_sensitive=False)
+                ] = item
 
         except Exception:
             import traceback
@@ -265,71 +288,111 @@ class AssetTreeWidget(QTreeWidget):
             self.filter_widget.filterChanged.emit()
 
     def tree_widget_item(self, filename):
-        name = os.path.basename(filename)
-        # In an ideal world (ie. not on windows), you should be able
-        # to do this like that.
-        # for i in self.findItems(name, Qt.MatchExactly):
-        # But instead you have to ignore case...
-        for i in self.findItems(name, Qt.MatchFixedString):
-            w = self.itemWidget(i, 1)
-            src_file = os.path.realpath(w.property(str('clientFile')))
-            if src_file.lower() == os.path.realpath(filename).lower():
-                # We have not totally given up, so we issue a warning
-                # to remember.
-                if src_file != os.path.realpath(filename):
-                    print(
-                        "WRN - Case mismatch between local and perforce file. "
-                        "({} / {})".format(
-                            repr(src_file), repr(os.path.realpath(filename))
-                        )
-                    )
-
-                return i
+        # In an ideal world (ie. not on windows), the lookup would be
+        # case sensitive. But instead you have to ignore case...
+        item = self._items.get(index.path_key(filename, case_sensitive=False))
+        if item is None:
+            raise RuntimeError("Filename {} has no item widget associated.".format(
+                repr(filename)
+            ))
+
+        src_file = os.path.realpath(self.itemWidget(item, 1).property(str('clientFile')))
+        # We have not totally given up, so we issue a warning
+        # to remember.
+        if src_file != os.path.realpath(filename):
+            print(
+                "WRN - Case mismatch between local and perforce file. "
+                "({} / {})".format(
+                    repr(src_file), repr(os.path.realpath(filename))
+                )
+            )
 
-        raise RuntimeError("Filename {} has no item widget associated.".format(
-            repr(filename)
-        ))
+        return item
 
     def tree_widget_items(self):
         return self.findItems("", Qt.MatchContains)
 
-    def update_perforce_infos(self):
-        item_dicts = []
-        with perforce.server.connect() as p4:
-            with p4.at_exception_level(p4.RAISE_NONE):
-                item_dicts += p4.run(
-                    'fstat',
-                    [
-                        d['clientFile']
-                        for d in [
-                            self.itemWidget(self.topLevelItem(i), 1).property_dict
-                            for i in range(self.topLevelItemCount())
-                        ]
-                    ]
-                )
+    def changelistSlot(self, changelist):
+        """
+        Update the rows of the files of `changelist`, a dict with a 'files'
+        key listing depot files such as emitted by
+        perforce.watcher.ChangelistWatcher.
+        """
+        local_paths = perforce.get_local_paths(changelist.get('files', []))
+        changed = set(
+            os.path.normcase(os.path.realpath(p))
+            for p in local_paths.values() if p is not None
+        )
+        filenames = [
+            f for f in self._client_files()
+            if os.path.normcase(os.path.realpath(f)) in changed
+        ]
+        if filenames != []:
+            self.update_perforce_infos(filenames)
 
-        for d in item_dicts:
-            item_widget = self.itemWidget(
-                self.tree_widget_item(d['clientFile']), 1
-            )
+    def _client_files(self):
+        return [
+            self.itemWidget(self.topLevelItem(i), 1).property(str('clientFile'))
+            for i in range(self.topLevelItemCount())
+        ]
 
-            if item_widget is None:
-                raise RuntimeError(
-                    "Cannot find item and/or widget for {}.".format(repr(d))
-                )
+    def selected_client_files(self):
+        return [
+            self.itemWidget(i, 1).property(str('clientFile'))
+            for i in self.selectedItems()
+        ]
 
-            # NOTES
-            # returned dict does not have necessary the haveRev and headRev
-            # depending if the file is opened for add / edit.
-            # Attributes name can differ depending of the action / headAction field.
-            # TODO: Investigate this more deeply.
-            # if 'haveRev' not in d:
-            #     print("WRN - No haveRev in dict the file is probably not synced.\n{}.".format(repr(d)))
-            #
-            # if 'headRev' not in d:
-            #     print("WRN - No headRev in dict the file is probably not synced.\n{}.".format(repr(d)))
-
-            item_widget.property_dict = d
-            item_widget.property_dict = { # FIXME APA Typo ??? Use dict.update instead ?
-                'isLatestRev': d.get('haveRev', "-1") == d.get('headRev', "0")
-            }
+    def sync_files(self, filenames):
+        """
+        Queue `filenames` to be synced in the background, progress is
+        reported by the `sync_queue` signals.
+        """
+        self.sync_queue.enqueue(filenames)
+
+    def syncBatchFinishedSlot(self, records):
+        """
+        Update the rows of the perforce.FileStat `records` of a synced batch.
+        """
+        for d in records:
+            self._update_row(d)
+
+    def _update_row(self, d):
+        item_widget = self.itemWidget(
+            self.tree_widget_item(d['clientFile']), 1
+        )
+
+        if item_widget is None:
+            raise RuntimeError(
+                "Cannot find item and/or widget for {}.".format(repr(d))
+            )
+
+        # NOTES
+        # returned dict does not have necessary the haveRev and headRev
+        # depending if the file is opened for add / edit.
+        # Attributes name can differ depending of the action / headAction field.
+        # TODO: Investigate this more deeply.
+        # if 'haveRev' not in d:
+        #     print("WRN - No haveRev in dict the file is probably not synced.\n{}.".format(repr(d)))
+        #
+        # if 'headRev' not in d:
+        #     print("WRN - No headRev in dict the file is probably not synced.\n{}.".format(repr(d)))
+
+        item_widget.property_dict = d
+        item_widget.property_dict = { # FIXME APA Typo ??? Use dict.update instead ?
+            'isLatestRev': d.get('haveRev', "-1") == d.get('headRev', "0")
+        }
+
+    def update_perforce_infos(self, filenames=None):
+        """
+        Update the perforce infos of the rows of `filenames`,
+        or of all the rows if None.
+        """
+        if filenames is None:
+            filenames = self._client_files()
+
+        # Chunks are fetched in parallel and rows are updated as soon as
+        # the records of the next chunk arrive from the server.
+        for d in perforce.iter_fstat_parallel(
+                filenames, fields=perforce.asset_tree_fstat_fields,
+                compact=True):
+            self._update_row(d)
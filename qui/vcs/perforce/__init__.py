@@ -26,26 +26,382 @@ with perforce.server.connect() as p4:
     first_function(p4_adapter=p4)
 ```
 """
+import atexit
+import collections
+import functools
 import os
+import queue
+import threading
+import time
+
+from concurrent.futures import (
+    CancelledError,
+    ThreadPoolExecutor,
+    TimeoutError,
+)
 
 from pprint import pprint
 
 from P4 import (
+    OutputHandler,
     P4,
     P4Exception,  # To have it accessible from perforce.P4Exception
 )
 
-from . import server
+from . import (
+    cache,
+    mapping,
+    server,
+    singleflight,
+    sqlite_cache,
+)
+from .records import FileStat
 
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 
 cache_timeout = timedelta(seconds=60)  # duration of the cache validity
+paths_chunk_size = 1000  # max number of paths sent in a single multi-path command
+paths_chunk_bytes = 256 * 1024  # max size of the paths sent in a single command
+fan_out_max_workers = 4  # default number of connections used in parallel
+
+# fstat fields (`p4 fstat -T`) needed by the AssetTreeWidget rows.
+asset_tree_fstat_fields = (
+    'clientFile', 'depotFile', 'haveRev', 'headRev', 'action', 'actionOwner',
+    'change', 'otherOpen', 'otherAction',
+)
 
-__memcache = {
-    # to store cached result, the p4 server thanking you for doing so.
-    # str(path): {'result': dict(fstat_cmd_result), 'date': datetime.datetime(age)
+# How cached results are invalidated:
+# 'timeout': `where` results are kept `cache_timeout`,
+#            `have` and `fstat` results are not cached.
+# 'change_counter': `where`, `have` and `fstat` results are kept until the
+#                   server change counter (polled every `change_poll_interval`)
+#                   moves or qui runs a command modifying the workspace.
+invalidation_mode = 'timeout'
+# Translate the paths in-process with the client view when possible instead
+# of using `p4 where`.
+use_client_view = True
+change_poll_interval = timedelta(seconds=10)
+# Share the in-flight server call of identical concurrent queries
+# (`p4 info`, pending changelists, `p4 where`) made without a p4_adapter.
+coalesce_requests = True
+in_flight = singleflight.Group()
+
+# to store cached results, the p4 server thanking you for doing so.
+# str(path): dict(where_cmd_result) or None
+local_where_cache = cache.Cache(max_size=100000, name='local_where')
+depot_where_cache = cache.Cache(max_size=100000, name='depot_where')
+# _normalize_where_key(path): str(client_path) or None
+have_cache = cache.Cache(max_size=100000, name='have')
+# _normalize_where_key(path): dict(fstat_cmd_result) or None
+fstat_cache = cache.Cache(max_size=100000, name='fstat')
+
+# sqlite_cache.SQLiteCache and its (server, client) key once
+# `enable_persistent_cache` has been called.
+persistent_cache = None
+__persistent_key = None
+__save_at_exit = False  # True once save_persistent_cache is registered atexit
+
+__change_lock = threading.Lock()
+__last_changes = {
+    # str(port): (int(change), float(monotonic poll time))
+}
+__client_updates = {
+    # (str(port), str(client)): str(client spec Update field)
 }
+__last_polls = {
+    # p4_adapter port or frozen env: float(monotonic poll time)
+}
+
+# Commands invalidating the `have` and `fstat` cached results.
+_workspace_commands = {
+    'add', 'clean', 'copy', 'delete', 'edit', 'flush', 'integ', 'integrate',
+    'lock', 'merge', 'move', 'reconcile', 'rename', 'reopen', 'resolve',
+    'revert', 'shelve', 'submit', 'sync', 'unlock', 'unshelve', 'update',
+}
+
+
+def _coalesced(func):
+    """
+    Decorator coalescing the identical concurrent calls of `func` made
+    without a `p4_adapter` into a single one (see `coalesce_requests`).
+    """
+    @functools.wraps(func)
+    def wrapper(*args, p4_adapter=None, env=None, **kwargs):
+        if p4_adapter is not None or coalesce_requests is False:
+            return func(*args, p4_adapter=p4_adapter, env=env, **kwargs)
+
+        key = (
+            func.__name__, singleflight.freeze(args),
+            singleflight.freeze(kwargs), singleflight.freeze(env),
+        )
+        return in_flight.do(key, func, *args, env=env, **kwargs)
+
+    return wrapper
+
+
+def _where_cache(path):
+    """
+    Return the `p4 where` cache to use for `path` depending on its syntax.
+    """
+    return depot_where_cache if path[0:2] == "//" else local_where_cache
+
+
+def _cache_ttl():
+    """
+    Return the ttl of the `where` cached results for the current
+    `invalidation_mode`.
+    """
+    return None if invalidation_mode == 'change_counter' else cache_timeout
+
+
+def invalidate_caches(prefix=None, where=True):
+    """
+    Remove the cached results of the paths starting with `prefix`
+    (either local or perforce syntax), or all of them if `prefix` is None.
+    `where` results are kept if `where` is False.
+    """
+    caches = [have_cache, fstat_cache]
+    if where is True:
+        caches += [local_where_cache, depot_where_cache]
+
+    for c in caches:
+        if prefix is None:
+            c.clear()
+
+        elif c in (have_cache, fstat_cache):
+            # Keyed by _normalize_where_key.
+            c.invalidate_prefix(_normalize_where_key(prefix))
+
+        else:
+            c.invalidate_prefix(prefix)
+
+
+def invalidate_paths(paths, where=True):
+    """
+    Remove the cached results of the files `paths` (either local or
+    perforce syntax) with exact key lookups, instead of the whole cache
+    scan `invalidate_caches` does for each directory prefix.
+    `where` results are kept if `where` is False.
+    """
+    for path in paths:
+        keys = {_normalize_where_key(path)}
+        if path[0:2] != "//":
+            keys.add(_normalize_where_key(os.path.realpath(path)))
+
+        for key in keys:
+            have_cache.invalidate(key)
+            fstat_cache.invalidate(key)
+
+        if where is True:
+            _where_cache(path).invalidate(path)
+
+
+def get_latest_change(p4_adapter=None, env=None):
+    """
+    Return the number of the latest changelist of the server as an int.
+    """
+    with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
+        with p4_adapter.at_exception_level(P4.RAISE_NONE):
+            res = p4_adapter.run('counter', 'change')
+            if res != [] and 'value' in res[0]:
+                return int(res[0]['value'])
+
+            res = p4_adapter.run('changes', '-m1')
+            return int(res[0]['change']) if res != [] else 0
+
+
+def check_change_counter(force=False, p4_adapter=None, env=None):
+    """
+    Poll the server change counter if `invalidation_mode` is
+    'change_counter' and the last poll is older than `change_poll_interval`
+    (or if `force` is True) and invalidate all the cached results if the
+    counter moved or if the client spec was updated (ie. its view edited
+    outside qui).
+    Return True if the caches were invalidated, False otherwise.
+    """
+    if invalidation_mode != 'change_counter':
+        return False
+
+    # Checked without any lock nor connection, most calls have nothing to do.
+    poll_key = (
+        p4_adapter.port if p4_adapter is not None
+        else ('env', singleflight.freeze(env))
+    )
+    last_poll = __last_polls.get(poll_key)
+    if (force is False and last_poll is not None and
+            time.monotonic() - last_poll < change_poll_interval.total_seconds()):
+        return False
+
+    with __change_lock:
+        with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
+            last_change, last_poll = __last_changes.get(
+                p4_adapter.port, (None, None)
+            )
+            if (force is False and last_poll is not None and
+                    time.monotonic() - last_poll
+                    < change_poll_interval.total_seconds()):
+                __last_polls[poll_key] = last_poll
+                return False
+
+            change = get_latest_change(p4_adapter=p4_adapter)
+            __last_changes[p4_adapter.port] = (change, time.monotonic())
+            __last_polls[poll_key] = __last_polls[p4_adapter.port] = time.monotonic()
+            client_key = (p4_adapter.port, p4_adapter.client)
+            last_update = __client_updates.get(client_key)
+            with p4_adapter.at_exception_level(P4.RAISE_NONE):
+                update = p4_adapter.fetch_client().get('Update')
+
+            __client_updates[client_key] = update
+            if update != p4_adapter.snapshot.client_spec.get('Update'):
+                p4_adapter.snapshot.refresh()
+
+    if last_change is not None and change != last_change:
+        invalidate_caches()
+        return True
+
+    if last_update is not None and update != last_update:
+        invalidate_caches()
+        return True
+
+    return False
+
+
+def acknowledge_change(change, paths=(), p4_adapter=None, env=None):
+    """
+    Invalidate the cached results of `paths` (local or perforce syntax)
+    only and record `change` as the latest change known of the server, so
+    `check_change_counter` does not invalidate everything for it.
+    Used by the watcher services knowing exactly which files were modified.
+    """
+    with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
+        with __change_lock:
+            last_change = __last_changes.get(p4_adapter.port, (None, None))[0]
+            if last_change is None or change > last_change:
+                __last_changes[p4_adapter.port] = (change, time.monotonic())
+
+        invalidate_paths(paths, where=False)
+        # Resolved by the server when the client view is ambiguous.
+        depot_paths = [p for p in paths if p[0:2] == "//"]
+        local_paths = (
+            get_local_paths(depot_paths, p4_adapter=p4_adapter)
+            if depot_paths != [] else {}
+        )
+        invalidate_paths(
+            [p for p in local_paths.values() if p is not None], where=False
+        )
+
+
+def _command_listener(p4_adapter, command, args):
+    """
+    Invalidate cached results when qui runs a command modifying
+    the workspace state.
+    """
+    if command in _workspace_commands:
+        invalidate_caches(where=False)
+
+    elif command in ('client', 'workspace') and (
+            '-i' in args or '-d' in args or '-s' in args):
+        invalidate_caches()
+
+
+server.command_listeners.append(_command_listener)
+
+
+def _persisted_caches():
+    return {
+        'where_local': local_where_cache,
+        'where_depot': depot_where_cache,
+        'have': have_cache,
+        'fstat': fstat_cache,
+    }
+
+
+def enable_persistent_cache(filename=None, p4_adapter=None, env=None):
+    """
+    Opt-in to keep the cached results between sessions in the SQLite
+    database `filename` (default to sqlite_cache.default_filename).
+    Results saved by a previous session for the same server and client are
+    loaded, except the `have` and `fstat` results of the files submitted
+    since they were saved (and the `where` results if the client spec was
+    updated) which are queried again when needed.
+    Results are saved at exit or when `save_persistent_cache` is called.
+    Note: `invalidation_mode` is switched to 'change_counter'.
+    Note: Syncs done outside qui between two sessions are not detected.
+    """
+    global persistent_cache, __persistent_key, invalidation_mode, __save_at_exit
+
+    store = sqlite_cache.SQLiteCache(filename)
+    with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
+        info = p4_adapter.snapshot.info
+        key = (info.get('serverAddress', p4_adapter.port), p4_adapter.client)
+        client_update = p4_adapter.snapshot.client_spec.get('Update')
+        saved_change, saved_client_update = store.stamp(*key)
+        change = get_latest_change(p4_adapter=p4_adapter)
+        with __change_lock:
+            __last_changes[p4_adapter.port] = (change, time.monotonic())
+
+        submitted = set()
+        if saved_change is not None and saved_change < change:
+            with p4_adapter.at_exception_level(P4.RAISE_NONE):
+                files = p4_adapter.run(
+                    'files', "//{}/...@{},@{}".format(
+                        p4_adapter.client, saved_change + 1, change
+                    )
+                )
+
+            # Local paths are resolved by the server when the client view
+            # is ambiguous (AltRoots, overlay mappings...).
+            depot_files = [f['depotFile'] for f in files]
+            submitted.update(depot_files)
+            submitted.update(
+                _normalize_where_key(p) for p in get_local_paths(
+                    depot_files, p4_adapter=p4_adapter
+                ).values()
+                if p is not None
+            )
+
+    if saved_change is not None:
+        for kind, c in _persisted_caches().items():
+            if kind.startswith('where') and saved_client_update != client_update:
+                continue
+
+            for path, value in store.load(*key, kind).items():
+                if kind in ('have', 'fstat'):
+                    if path in submitted or (path[0:2] != "//" and
+                            _normalize_where_key(os.path.realpath(path))
+                            in submitted):
+                        continue
+
+                c.set(path, value, ttl=None)
+
+    persistent_cache, __persistent_key = store, key
+    invalidation_mode = 'change_counter'
+    if __save_at_exit is False:
+        atexit.register(save_persistent_cache)
+        __save_at_exit = True
+
+
+def save_persistent_cache(p4_adapter=None, env=None):
+    """
+    Save the cached results into the persistent cache if it is enabled.
+    """
+    if persistent_cache is None:
+        return
+
+    with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
+        client_update = p4_adapter.snapshot.client_spec.get('Update')
+        with __change_lock:
+            change = __last_changes.get(p4_adapter.port, (None, None))[0]
+
+        if change is None:
+            change = get_latest_change(p4_adapter=p4_adapter)
+
+    persistent_cache.save(
+        *__persistent_key,
+        {kind: c.items() for kind, c in _persisted_caches().items()},
+        change, client_update
+    )
 
 
 def get_current_configuration_dict(p4_adapter=None):
@@ -56,7 +412,8 @@ def get_current_configuration_dict(p4_adapter=None):
         ret = {
             "user": p4_adapter.user,
             "server_level": (
-                p4_adapter.server_level if p4_adapter.connected() else None,
+                p4_adapter.snapshot.server_level
+                if p4_adapter.connected() else None
             ),
             "port": p4_adapter.port,
             "client": p4_adapter.client,
@@ -69,6 +426,7 @@ def get_current_configuration_dict(p4_adapter=None):
         return ret
 
 
+@_coalesced
 def get_info(p4_adapter=None, env=None):
     """
     Return a dict containing the results from a `p4 info` command.
@@ -81,16 +439,16 @@ def is_file_perforced(file_path, p4_adapter=None, env=None):
     """
     Return True if file `file_path` is in perforce, False otherwise.
     Note: Does not work with directory name.
+    The answer comes from a loaded index.WorkspaceIndex containing
+    `file_path` if there is one.
     """
-    import os
-    with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
-        with p4_adapter.at_exception_level(P4.RAISE_NONE):
-            path = (
-                os.path.realpath(file_path)
-                if file_path[0:2] != "//"
-                else file_path
-            )
-            return True if p4_adapter.run("have", path) else False
+    workspace_index = index.find(file_path, env=env, p4_adapter=p4_adapter)
+    if workspace_index is not None:
+        return workspace_index.is_perforced(file_path)
+
+    return filter_perforced_filenames(
+        [file_path], p4_adapter=p4_adapter, env=env
+    ) != []
 
 
 def is_under_client_root(path, p4_adapter=None, env=None):
@@ -100,25 +458,203 @@ def is_under_client_root(path, p4_adapter=None, env=None):
     with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
         with p4_adapter.at_exception_level(P4.RAISE_NONE):
             path = os.path.realpath(path)
-            client_root = os.path.realpath(get_info(p4_adapter=p4_adapter)['clientRoot'])
-            return (client_root + os.path.sep) in path
+            client_root = p4_adapter.snapshot.client_root
+            return client_root is not None and (client_root + os.path.sep) in path
 
 
-def filter_perforced_filenames(paths, p4_adapter=None, env=None):
+def filter_perforced_filenames(paths, p4_adapter=None, env=None, root=None):
     """
     Returned filtered `paths` list with only the perforced paths.
     (Note: Only the client path is returned for each matching entry)
+    Paths are checked with chunked `p4 have` calls, or with a single
+    `p4 have root/...` call if `root` (a local or perforce directory
+    containing all the `paths`) is provided.
     """
-    filtered_paths = []
-    with server.connect(p4_adapter=p4_adapter, env=env) as p4_adapter:
-        paths = get_project_paths_to_client_root(
-            paths, p4_adapter=p4_adapter, env=env
-        )
-        for p in paths:
-            if is_file_perforced(p, p4_adapter=p4_adapter, env=env) is True:
-                filtered_paths.append(p)
+    have = _have(paths, p4_adapter=p4_adapter, env=env, root=root)
+    return [have[p] for p in paths if have[p] is not None]
+
+
+def _have(paths, p4_adapter=None, env=None, root=None):
+    """
+    Return a dict {path: client_path or None} for each entry of `paths`,
+    None being used for the files not synced.
+    See `filter_perforced_filenames`.
+    """
+    queries = [
+        os.path.realpath(p) if p[0:2] != "//" else p
+        for p in paths
+    ]
+    use_cache = invalidation_mode == 'change_counter'
+    have = {}
+    to_query = queries
+    if use_cache is True:
+        check_change_counter(p4_adapter=p4_adapter, env=env)
+        to_query = []
+        for q in queries:
+            client_path = have_cache.get(_normalize_where_key(q), cache.MISSING)
+            if client_path is cache.MISSING:
+                to_query.append(q)
+
+            elif client_path is not None:
+                have[_normalize_where_key(q)] = client_path
+
+    results = []
+    if to_query != []:
+        # Only connect if something is not cached.
+        with server.connect(p4_adapter=p4_adapter, env=env) as p4_adapter:
+            with p4_adapter.at_exception_level(P4.RAISE_NONE):
+                if root is not None:
+                    sep = '/' if root[0:2] == "//" else os.path.sep
+                    results = p4_adapter.run(
+                        'have', "{}{}...".format(root.rstrip('/\\'), sep)
+                    )
+
+                else:
+                    results = run_batched(p4_adapter, 'have', to_query)
+
+    for r in results:
+        have[r['depotFile']] = r['path']
+        have[_normalize_where_key(r['path'])] = r['path']
+
+    if use_cache is True:
+        for q in to_query:
+            have_cache.set(
+                _normalize_where_key(q), have.get(_normalize_where_key(q)),
+                ttl=None
+            )
+
+    return {
+        p: have.get(_normalize_where_key(q))
+        for p, q in zip(paths, queries)
+    }
+
+
+def iter_batches(paths, chunk_size=None, chunk_bytes=None):
+    """
+    Yield lists of consecutive `paths` holding at most `chunk_size` paths
+    (default to `paths_chunk_size`) and `chunk_bytes` utf-8 encoded bytes
+    (default to `paths_chunk_bytes`), a longer path being yielded alone.
+    Multi-path helpers send their paths through it so huge lists stay below
+    the server argument limits.
+    """
+    chunk_size = chunk_size or paths_chunk_size
+    chunk_bytes = chunk_bytes or paths_chunk_bytes
+    batch = []
+    batch_bytes = 0
+    for path in paths:
+        size = len(path.encode('utf-8')) + 1
+        if batch != [] and (len(batch) >= chunk_size or
+                            batch_bytes + size > chunk_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+
+        batch.append(path)
+        batch_bytes += size
+
+    if batch != []:
+        yield batch
+
+
+def run_batched(p4_adapter, command, paths, args=()):
+    """
+    Return the concatenated results of `p4 command args batch` run with
+    the connected `p4_adapter` for each batch of `paths`.
+    See `iter_batches`.
+    """
+    results = []
+    for batch in iter_batches(paths):
+        results += p4_adapter.run(command, *args, batch)
 
-    return filtered_paths
+    return results
+
+
+def _normalize_where_key(path):
+    """
+    Return a comparable version of `path` (either local or perforce syntax)
+    to match `p4 where` results against the queried paths.
+    """
+    if path[0:2] == "//":
+        return path
+
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _where(paths, p4_adapter=None, env=None):
+    """
+    Return a dict {path: where_result_dict or None} for each entry of `paths`
+    using as few `p4 where` calls as possible.
+    `paths` must already have the __QUI_MARKER__ suffix for directories.
+    Results are cached into `local_where_cache` or `depot_where_cache`.
+    """
+    if invalidation_mode == 'change_counter':
+        check_change_counter(p4_adapter=p4_adapter, env=env)
+
+    ret = {}
+    to_query = []
+    for path in paths:
+        if path in ret:
+            continue
+
+        ret[path] = _where_cache(path).get(path, cache.MISSING)
+        if ret[path] is cache.MISSING:
+            ret[path] = None
+            to_query.append(path)
+
+    if to_query == []:
+        return ret
+
+    with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
+        to_ask = to_query
+        if use_client_view is True:
+            view = p4_adapter.snapshot.client_view
+            to_ask = []
+            for path in to_query:
+                ret[path] = view.where(path)
+                if ret[path] is mapping.AMBIGUOUS:
+                    ret[path] = None
+                    to_ask.append(path)
+
+        with p4_adapter.at_exception_level(p4_adapter.RAISE_NONE):
+            for chunk in iter_batches(to_ask):
+                res = [r for r in p4_adapter.run('where', chunk) if 'unmap' not in r]
+                if len(chunk) == 1:
+                    ret[chunk[0]] = res[0] if res != [] else None
+                    continue
+
+                # `p4 where` does not return anything for unmapped files,
+                # so results are matched by value instead of by position.
+                lookup = {}
+                for r in res:
+                    for k in ('depotFile', 'clientFile', 'path'):
+                        lookup.setdefault(_normalize_where_key(r[k]), r)
+
+                for path in chunk:
+                    ret[path] = lookup.get(_normalize_where_key(path))
+
+    for path in to_query:
+        _where_cache(path).set(path, ret[path], ttl=_cache_ttl())
+
+    return ret
+
+
+def _where_mapping(paths, key, p4_adapter=None, env=None):
+    """
+    Return a dict {path: mapped_path or None} with mapped_path being the
+    `key` field of the `p4 where` result for each entry of `paths`.
+    """
+    queries = {
+        p: p + "__QUI_MARKER__" if p.endswith('/') else p
+        for p in paths
+    }
+    results = _where(list(queries.values()), p4_adapter=p4_adapter, env=env)
+    return {
+        p: (
+            results[q][key].split('__QUI_MARKER__')[0]
+            if results[q] is not None else None
+        )
+        for p, q in queries.items()
+    }
 
 
 def get_depot_path(local_path, p4_adapter=None, env=None):
@@ -129,31 +665,85 @@ def get_depot_path(local_path, p4_adapter=None, env=None):
     Path directory can be found by putting a trailing slash in
     the local_path argument.
     """
-    global __memcache, cache_timeout
+    return get_depot_paths(
+        [local_path], p4_adapter=p4_adapter, env=env
+    )[local_path]
 
-    if local_path.endswith('/'):  # since p4 where only works on filename (0o)
-        local_path += "__QUI_MARKER__"
 
-    if local_path in __memcache:
-        if datetime.now() - __memcache[local_path]['date'] < cache_timeout:
-            result = __memcache[local_path]['result']
-            return (
-                result['depotFile'].split('__QUI_MARKER__')[0]
-                if result is not None else None
-            )
+@_coalesced
+def get_depot_paths(local_paths, p4_adapter=None, env=None):
+    """
+    Return a dict {local_path: perforce_path or None} for each entry of
+    `local_paths`, None being used if no mapping is found.
+    Same as `get_depot_path` but all the uncached paths are resolved
+    with chunked `p4 where` calls instead of one call per path.
+    """
+    return _where_mapping(
+        local_paths, 'depotFile', p4_adapter=p4_adapter, env=env
+    )
+
 
+def _fstat(paths, p4_adapter=None, env=None):
+    """
+    Return a dict {path: fstat_result_dict or None} for each entry of `paths`
+    using batched `p4 fstat` calls.
+    Only the 'depotFile', 'clientFile' and 'haveRev' fields are fetched.
+    Results are cached into `fstat_cache` if `invalidation_mode` is
+    'change_counter'.
+    """
+    use_cache = invalidation_mode == 'change_counter'
+    ret = {}
+    to_query = []
+    if use_cache is True:
+        check_change_counter(p4_adapter=p4_adapter, env=env)
+
+    for path in paths:
+        if path in ret:
+            continue
+
+        ret[path] = (
+            fstat_cache.get(_normalize_where_key(path), cache.MISSING)
+            if use_cache is True else cache.MISSING
+        )
+        if ret[path] is cache.MISSING:
+            ret[path] = None
+            to_query.append(path)
+
+    if to_query == []:
+        return ret
+
+    # Only connect if something is not cached.
+    args = fstat_args(fields=('depotFile', 'clientFile', 'haveRev'))
     with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
         with p4_adapter.at_exception_level(p4_adapter.RAISE_NONE):
-            res = p4_adapter.run('where', local_path)
+            for chunk in iter_batches(to_query):
+                res = p4_adapter.run('fstat', *args, chunk)
+                if len(chunk) == 1:
+                    # The server can rewrite the path (ie. client syntax).
+                    ret[chunk[0]] = res[0] if res != [] else None
+                    continue
 
-    __memcache[local_path] = {
-        'result': res[0] if res != [] else None,
-        'date': datetime.now()
-    }
-    return (
-        __memcache[local_path]['result']['depotFile'].split('__QUI_MARKER__')[0]
-        if res != [] else None
-    )
+                # Files unknown to perforce have no result, so results are
+                # matched by value instead of by position.
+                lookup = {}
+                for r in res:
+                    for k in ('depotFile', 'clientFile'):
+                        if k in r:
+                            lookup.setdefault(_normalize_where_key(r[k]), r)
+
+                for path in chunk:
+                    ret[path] = lookup.get(_normalize_where_key(path))
+                    if ret[path] is None and path[0:2] == "//":
+                        # Client syntax paths are matched by depot path.
+                        mapped = p4_adapter.snapshot.client_view.where(path)
+                        if isinstance(mapped, dict):
+                            ret[path] = lookup.get(mapped['depotFile'])
+
+    for path in to_query:
+        if use_cache is True:
+            fstat_cache.set(_normalize_where_key(path), ret[path], ttl=None)
+
+    return ret
 
 
 def resolve_local_path_with_revision(path, ensure_perforced=False,
@@ -164,18 +754,42 @@ def resolve_local_path_with_revision(path, ensure_perforced=False,
     or `path` if `ensure_perforced` is set to True.
     If path is outside the workspace file system, path is returned.
     """
-    with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
-        if ensure_perforced is True:
-            if is_file_perforced(path, p4_adapter=p4_adapter) is False:
-                return path
+    return resolve_local_paths_with_revision(
+        [path], ensure_perforced=ensure_perforced,
+        p4_adapter=p4_adapter, env=env
+    )[0]
 
-        with p4_adapter.at_exception_level(p4_adapter.RAISE_NONE):
-            res = p4_adapter.run('fstat', path)
-            if res == []:
-                res = get_depot_path(path, p4_adapter=p4_adapter)
-                return path if res is None else res
 
-            return "{}#{}".format(res[0]['depotFile'], res[0].get('haveRev', '-1'))
+def resolve_local_paths_with_revision(paths, ensure_perforced=False,
+                                      p4_adapter=None, env=None):
+    """
+    Return the list of the resolved perforce paths //perforce_path#(rev)
+    of `paths`, in the same order (see `resolve_local_path_with_revision`).
+    All the paths are resolved with batched `p4 fstat` calls, plus batched
+    `p4 where` calls for the paths unknown to perforce.
+    """
+    # No connection is checked out when everything is cached.
+    records = _fstat(paths, p4_adapter=p4_adapter, env=env)
+    misses = [p for p in paths if records[p] is None]
+    depot_paths = (
+        get_depot_paths(misses, p4_adapter=p4_adapter, env=env)
+        if misses != [] and ensure_perforced is False else {}
+    )
+
+    ret = []
+    for path in paths:
+        res = records[path]
+        if res is None:
+            depot_path = depot_paths.get(path)
+            ret.append(path if depot_path is None else depot_path)
+
+        elif ensure_perforced is True and 'haveRev' not in res:
+            ret.append(path)
+
+        else:
+            ret.append("{}#{}".format(res['depotFile'], res.get('haveRev', '-1')))
+
+    return ret
 
 
 def get_local_path(perforce_path, p4_adapter=None, env=None):
@@ -186,44 +800,268 @@ def get_local_path(perforce_path, p4_adapter=None, env=None):
     Path directory can be found by putting a trailing slash in
     the perforce_path argument.
     """
-    global __memcache, cache_timeout
+    return get_local_paths(
+        [perforce_path], p4_adapter=p4_adapter, env=env
+    )[perforce_path]
 
-    if perforce_path.endswith('/'):  # since p4 where only works on filename (0o)
-        perforce_path += "__QUI_MARKER__"
 
-    if perforce_path in __memcache:
-        if datetime.now() - __memcache[perforce_path]['date'] < cache_timeout:
-            result = __memcache[perforce_path]['result']
-            return (
-                result['path'].split('__QUI_MARKER__')[0]
-                if result is not None else None
-            )
+@_coalesced
+def get_local_paths(perforce_paths, p4_adapter=None, env=None):
+    """
+    Return a dict {perforce_path: local_path or None} for each entry of
+    `perforce_paths`, None being used if no mapping is found.
+    Same as `get_local_path` but all the uncached paths are resolved
+    with chunked `p4 where` calls instead of one call per path.
+    """
+    return _where_mapping(
+        perforce_paths, 'path', p4_adapter=p4_adapter, env=env
+    )
+
+
+class _QueueOutputHandler(OutputHandler):
+    """
+    OutputHandler pushing the tagged records into a bounded queue.
+    """
+
+    def __init__(self, records, cancel_event):
+        super().__init__()
+        self.records = records
+        self.cancel_event = cancel_event
+
+    def outputStat(self, stat):
+        while self.cancel_event.is_set() is False:
+            try:
+                self.records.put(stat, timeout=0.1)
+                return OutputHandler.HANDLED
 
+            except queue.Full:
+                continue
+
+        return OutputHandler.CANCEL
+
+
+__end_of_records = object()
+
+
+def iter_run(command, paths, args=(), buffer_size=1000,
+             p4_adapter=None, env=None):
+    """
+    Yield the tagged records of `p4 command args paths` as soon as they are
+    received from the server instead of returning the whole result list.
+    `paths` are sent by batches (see `iter_batches`), at most `buffer_size`
+    records are kept in memory waiting to be consumed.
+    Closing the generator before its end cancels the command.
+    Note: The connection is used by a worker thread until the generator is
+    exhausted or closed, do not use it for anything else in the meantime.
+    """
     with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
-        with p4_adapter.at_exception_level(p4_adapter.RAISE_NONE):
-            res = p4_adapter.run('where', perforce_path)
+        records = queue.Queue(maxsize=buffer_size)
+        cancel_event = threading.Event()
+        errors = []
 
-    __memcache[perforce_path] = {
-        'result': res[0] if res != [] else None,
-        'date': datetime.now()
-    }
-    return (
-        __memcache[perforce_path]['result']['path'].split('__QUI_MARKER__')[0]
-        if res != [] else None
+        def worker():
+            try:
+                handler = _QueueOutputHandler(records, cancel_event)
+                with p4_adapter.lock:
+                    with p4_adapter.at_exception_level(P4.RAISE_NONE):
+                        with p4_adapter.using_handler(handler):
+                            for chunk in iter_batches(paths):
+                                if cancel_event.is_set() is True:
+                                    break
+
+                                p4_adapter.run(command, *args, chunk)
+
+            except Exception as e:
+                errors.append(e)
+
+            finally:
+                while cancel_event.is_set() is False:
+                    try:
+                        records.put(__end_of_records, timeout=0.1)
+                        break
+
+                    except queue.Full:
+                        continue
+
+        thread = threading.Thread(target=worker, name="qui-p4-iter", daemon=True)
+        thread.start()
+        try:
+            while True:
+                record = records.get()
+                if record is __end_of_records:
+                    break
+
+                yield record
+
+        finally:
+            cancel_event.set()
+            thread.join()
+
+        if errors != []:
+            raise errors[0]
+
+
+def _iter_compact(records):
+    """
+    Yield the FileStat version of the `records` generator dicts.
+    """
+    try:
+        for r in records:
+            yield FileStat.from_dict(r)
+
+    finally:
+        records.close()
+
+
+def fstat_args(args=(), fields=None, filter_expression=None):
+    """
+    Return the `p4 fstat` arguments list `args` with the options to only
+    return the `fields` list (-T) of the files matching the
+    `filter_expression` (-F) if they are provided.
+    """
+    ret = list(args)
+    if fields is not None:
+        ret = ['-T', ','.join(fields)] + ret
+
+    if filter_expression is not None:
+        ret = ['-F', filter_expression] + ret
+
+    return ret
+
+
+def iter_fstat(paths, args=(), fields=None, filter_expression=None,
+               compact=False, p4_adapter=None, env=None):
+    """
+    Yield the `p4 fstat` records of `paths` as they arrive,
+    as FileStat records instead of dicts if `compact` is True.
+    See `fstat_args` for `fields` and `filter_expression` and `iter_run`.
+    """
+    records = iter_run(
+        'fstat', paths, args=fstat_args(args, fields, filter_expression),
+        p4_adapter=p4_adapter, env=env
     )
+    return _iter_compact(records) if compact is True else records
+
+
+def iter_files(paths, args=(), p4_adapter=None, env=None):
+    """
+    Yield the `p4 files` records of `paths` as they arrive.
+    See `iter_run`.
+    """
+    return iter_run('files', paths, args=args, p4_adapter=p4_adapter, env=env)
+
+
+def iter_run_parallel(command, paths, args=(), max_workers=None,
+                      chunk_size=None, cancel_event=None, env=None):
+    """
+    Yield the tagged records of `p4 command args paths`, the `paths` being
+    split into batches of `chunk_size` (see `iter_batches`) sent
+    in parallel on up to `max_workers` (default to `fan_out_max_workers`)
+    pooled connections.
+    Records are yielded in the `paths` order.
+    At most 2 * `max_workers` chunks are in flight, the next one being sent
+    as each is consumed, so memory does not grow with the whole result.
+    If the threading.Event `cancel_event` is set, the remaining chunks are
+    dropped and CancelledError is raised.
+    """
+    max_workers = max_workers or fan_out_max_workers
+    chunks = iter_batches(paths, chunk_size=chunk_size)
+    cancel_event = cancel_event or threading.Event()
+    stop_event = threading.Event()  # set when the generator is closed
+
+    def run_chunk(chunk):
+        if cancel_event.is_set() is True or stop_event.is_set() is True:
+            raise CancelledError()
+
+        with server.connect(env=env) as p4_adapter:
+            with p4_adapter.at_exception_level(P4.RAISE_NONE):
+                return p4_adapter.run(command, *args, chunk)
+
+    with ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="qui-p4-fan-out") as executor:
+        futures = collections.deque()
+
+        def submit_next():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                futures.append(executor.submit(run_chunk, chunk))
+
+        try:
+            for _ in range(2 * max_workers):
+                submit_next()
+
+            while futures:
+                future = futures.popleft()
+                while True:
+                    if cancel_event.is_set() is True:
+                        raise CancelledError()
+
+                    try:
+                        records = future.result(timeout=0.1)
+                        break
+
+                    except TimeoutError:
+                        continue
+
+                # The future is dropped, only this chunk records are kept.
+                del future
+                submit_next()
+                yield from records
+                del records
+
+        finally:
+            stop_event.set()
+            for future in futures:
+                future.cancel()
+
+
+def iter_fstat_parallel(paths, args=(), fields=None, filter_expression=None,
+                        compact=False, max_workers=None, chunk_size=None,
+                        cancel_event=None, env=None):
+    """
+    Yield the `p4 fstat` records of `paths` fetched in parallel,
+    as FileStat records instead of dicts if `compact` is True.
+    See `fstat_args` for `fields` and `filter_expression` and
+    `iter_run_parallel`.
+    """
+    records = iter_run_parallel(
+        'fstat', paths, args=fstat_args(args, fields, filter_expression),
+        max_workers=max_workers, chunk_size=chunk_size,
+        cancel_event=cancel_event, env=env
+    )
+    return _iter_compact(records) if compact is True else records
+
+
+def fstat_parallel(paths, args=(), fields=None, filter_expression=None,
+                   compact=False, max_workers=None, chunk_size=None,
+                   cancel_event=None, env=None):
+    """
+    Return the list of the `p4 fstat` records of `paths` fetched in parallel,
+    as FileStat records instead of dicts if `compact` is True.
+    See `fstat_args` for `fields` and `filter_expression` and
+    `iter_run_parallel`.
+    """
+    return list(iter_fstat_parallel(
+        paths, args=args, fields=fields, filter_expression=filter_expression,
+        compact=compact, max_workers=max_workers, chunk_size=chunk_size,
+        cancel_event=cancel_event, env=env
+    ))
 
 
 def get_current_user_pending_changelists_numbers(p4_adapter=None, env=None):
     """
     Return the list of all current user pending changelist numbers.
     """
-    with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
-        return [
-            c['change']
-            for c in get_current_user_pending_changelists(p4_adapter=p4_adapter)
-        ]
+    return [
+        c['change']
+        for c in get_current_user_pending_changelists(
+            p4_adapter=p4_adapter, env=env
+        )
+    ]
 
 
+@_coalesced
 def get_current_user_pending_changelists(p4_adapter=None, env=None):
     """
     Return the list of all current user pending changelists.
@@ -260,28 +1098,16 @@ def has_pending_changelist(changelist_number, p4_adapter=None, env=None):
     return str(changelist_number) in pending_cls
 
 
-class CurrentUser(object):
-    """
-    Utility class for contextual metas retrieval based on
-    the current perforce user.
-    """
-    @property
-    def login(self):
-        """
-        Current perforce user name.
-        """
-        return get_current_configuration_dict()['user']
+from . import index
+
 
-    @property
-    def pending_changelist_numbers(self):
-        """
-        Current user pending changelists numbers.
-        """
-        return get_current_user_pending_changelists_numbers()
+def __getattr__(name):
+    # CurrentUser needs Qt, so it is only imported when used to keep the
+    # rest of the module usable without it.
+    if name == 'CurrentUser':
+        from .session import CurrentUser
+        return CurrentUser
 
-    @property
-    def pending_changelists(self):
-        """
-        Current user pending changelists.
-        """
-        return get_current_user_pending_changelists()
+    raise AttributeError("module {} has no attribute {}".format(
+        repr(__name__), repr(name)
+    ))
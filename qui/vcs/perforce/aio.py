@@ -0,0 +1,163 @@
+"""
+    asyncio facade of the perforce helpers.
+
+The helpers run on a thread pool executor, each call checking out its own
+pooled connection so independent queries overlap, while the calls sharing
+an explicit `p4_adapter` are serialized on this adapter.
+It only relies on `loop.run_in_executor` so it works with any asyncio
+compatible event loop, Qt ones included (qasync, PySide6.QtAsyncio).
+
+Example
+```python
+import asyncio
+
+from qui.vcs.perforce import aio
+
+async def main():
+    info, changelists = await asyncio.gather(
+        aio.get_info(),
+        aio.get_current_user_pending_changelists(),
+    )
+```
+"""
+import asyncio
+import functools
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .. import perforce
+from . import (
+    batcher,
+    server,
+    singleflight,
+)
+
+max_workers = 4  # number of threads (and so of connections) used by the executor
+# Resolve the per-path helpers called by concurrent tasks with batched commands.
+batching = True
+
+__executor = None
+__executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the executor used to run the perforce commands,
+    creating it if necessary.
+    """
+    global __executor
+
+    with __executor_lock:
+        if __executor is None:
+            __executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="qui-p4"
+            )
+
+        return __executor
+
+
+def shutdown(wait=True):
+    """
+    Shutdown the executor, a new one is created on the next call.
+    """
+    global __executor
+
+    with __executor_lock:
+        executor, __executor = __executor, None
+
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _call(func, args, kwargs):
+    p4_adapter = kwargs.get('p4_adapter')
+    if p4_adapter is None:
+        return func(*args, **kwargs)
+
+    with p4_adapter.lock:
+        return func(*args, **kwargs)
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """
+    Run `func(*args, **kwargs)` on the executor and return its result.
+    Calls using the same `p4_adapter` keyword argument are serialized.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(_call, func, args, kwargs)
+    )
+
+
+def _run_command(*args, p4_adapter=None, env=None):
+    with server.connect(env=env, p4_adapter=p4_adapter) as p4_adapter:
+        return p4_adapter.run(*args)
+
+
+async def run(*args, p4_adapter=None, env=None):
+    """
+    Run the perforce command `args` and return its result.
+    """
+    return await run_in_executor(
+        _run_command, *args, p4_adapter=p4_adapter, env=env
+    )
+
+
+def _batched(func, path_batcher):
+    """
+    Wrap the per-path helper `func` so the paths requested by concurrent
+    tasks during the same loop tick are resolved with a single multi-path
+    command by `path_batcher` (see batcher.Batcher).
+    """
+    wrapped = _wrap(func)
+
+    @functools.wraps(func)
+    async def wrapper(path, p4_adapter=None, env=None):
+        if p4_adapter is None and env is None and batching is True:
+            return await path_batcher.load_async(path)
+
+        return await wrapped(path, p4_adapter=p4_adapter, env=env)
+
+    return wrapper
+
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if kwargs.get('p4_adapter') is None and perforce.coalesce_requests is True:
+            # Identical concurrent tasks share the same executor job.
+            key = (
+                func.__name__, singleflight.freeze(args),
+                singleflight.freeze(kwargs),
+            )
+            return await perforce.in_flight.do_async(
+                key, run_in_executor, func, *args, **kwargs
+            )
+
+        return await run_in_executor(func, *args, **kwargs)
+
+    return wrapper
+
+
+get_current_configuration_dict = _wrap(perforce.get_current_configuration_dict)
+get_info = _wrap(perforce.get_info)
+get_latest_change = _wrap(perforce.get_latest_change)
+is_file_perforced = _batched(perforce.is_file_perforced, batcher.perforced)
+is_under_client_root = _wrap(perforce.is_under_client_root)
+filter_perforced_filenames = _wrap(perforce.filter_perforced_filenames)
+get_depot_path = _batched(perforce.get_depot_path, batcher.depot_paths)
+get_depot_paths = _wrap(perforce.get_depot_paths)
+get_local_path = _batched(perforce.get_local_path, batcher.local_paths)
+get_local_paths = _wrap(perforce.get_local_paths)
+resolve_local_path_with_revision = _wrap(perforce.resolve_local_path_with_revision)
+resolve_local_paths_with_revision = _wrap(
+    perforce.resolve_local_paths_with_revision
+)
+get_current_user_pending_changelists_numbers = _wrap(
+    perforce.get_current_user_pending_changelists_numbers
+)
+get_current_user_pending_changelists = _wrap(
+    perforce.get_current_user_pending_changelists
+)
+has_pending_changelist = _wrap(perforce.has_pending_changelist)
@@ -0,0 +1,199 @@
+"""
+    DataLoader-style batching of per-path lookups.
+
+The per-path requests made within a short window (from several threads) or
+within the same event loop tick (from several asyncio tasks) are collected
+and dispatched as a single multi-path command, each caller getting its own
+result.
+
+Example
+```python
+import asyncio
+
+from qui.vcs.perforce import batcher
+
+async def depot_path(path):
+    return await batcher.depot_paths.load_async(path)
+
+async def main(paths):
+    # A single batched `p4 where` for all the paths.
+    return await asyncio.gather(*(depot_path(p) for p in paths))
+```
+"""
+import asyncio
+import threading
+
+from concurrent.futures import Future
+
+from .. import perforce
+
+
+class Batcher(object):
+    """
+    Collect the keys requested with `submit` / `load` during `window`
+    seconds, or with `load_async` during the current event loop tick, and
+    resolve them with a single `batch_func(keys)` call returning a dict
+    {key: value} (missing keys get None).
+    """
+
+    def __init__(self, batch_func, window=0.005, max_batch_size=None,
+                 executor=None):
+        """
+        `window` is the number of seconds the keys of the threaded callers
+        are collected for.
+        A batch is dispatched as soon as it holds `max_batch_size` keys
+        (default to perforce.paths_chunk_size).
+        `executor` runs `batch_func` for the asyncio callers, either an
+        Executor, a callable returning one, or None for the loop default.
+        """
+        self.batch_func = batch_func
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.executor = executor
+        self.__lock = threading.Lock()
+        self.__pending = {}  # key: [concurrent.futures.Future]
+        self.__timer = None
+        self.__async_pending = {}  # loop: {key: [asyncio.Future]}
+        self.__tasks = set()  # running asyncio tasks, referenced until done
+
+    def _max_batch_size(self):
+        return self.max_batch_size or perforce.paths_chunk_size
+
+    @staticmethod
+    def _resolve(pending, results, error, set_result, set_exception):
+        """
+        Resolve the futures of `pending` with their value in `results`,
+        or with the exception `error` if it is not None.
+        """
+        for key, futures in pending.items():
+            for f in futures:
+                if error is not None:
+                    set_exception(f, error)
+
+                else:
+                    set_result(f, results.get(key))
+
+    def submit(self, key):
+        """
+        Return a concurrent.futures.Future of the value of `key`.
+        """
+        future = Future()
+        with self.__lock:
+            self.__pending.setdefault(key, []).append(future)
+            full = len(self.__pending) >= self._max_batch_size()
+            if full is False and self.__timer is None:
+                self.__timer = threading.Timer(self.window, self.dispatch)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+        if full is True:
+            self.dispatch()
+
+        return future
+
+    def dispatch(self):
+        """
+        Resolve the keys submitted so far without waiting for the window.
+        """
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+
+        if pending == {}:
+            return
+
+        results, error = None, None
+        try:
+            results = self.batch_func(list(pending))
+
+        except Exception as e:
+            error = e
+
+        self._resolve(
+            pending, results, error,
+            lambda f, v: f.set_result(v),
+            lambda f, e: f.set_exception(e),
+        )
+
+    def load(self, key):
+        """
+        Return the value of `key`, waiting for its batch to be dispatched.
+        """
+        return self.submit(key).result()
+
+    async def load_async(self, key):
+        """
+        Return the value of `key`, the keys requested by the tasks of the
+        running loop during the same tick being dispatched together.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.__lock:
+            pending = self.__async_pending.setdefault(loop, {})
+            if pending == {}:
+                # Scheduled after the tasks already ready to run.
+                loop.call_soon(self.__dispatch_async, loop)
+
+            pending.setdefault(key, []).append(future)
+
+        return await future
+
+    def __dispatch_async(self, loop):
+        with self.__lock:
+            pending = self.__async_pending.pop(loop, {})
+
+        keys = list(pending)
+        size = self._max_batch_size()
+        for i in range(0, len(keys), size):
+            task = loop.create_task(self.__resolve_async(
+                loop, {k: pending[k] for k in keys[i:i + size]}
+            ))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+    async def __resolve_async(self, loop, pending):
+        executor = self.executor() if callable(self.executor) else self.executor
+        results, error = None, None
+        try:
+            results = await loop.run_in_executor(
+                executor, self.batch_func, list(pending)
+            )
+
+        except Exception as e:
+            error = e
+
+        # Futures of cancelled callers are skipped.
+        self._resolve(
+            pending, results, error,
+            lambda f, v: f.done() or f.set_result(v),
+            lambda f, e: f.done() or f.set_exception(e),
+        )
+
+
+def _executor():
+    from . import aio
+    return aio.get_executor()
+
+
+def _is_perforced(paths):
+    # Looked up once, indexes can be loaded or collected meanwhile. Only
+    # the indexes of the default connection settings match.
+    indexes = {p: perforce.index.find(p) for p in paths}
+    to_query = [p for p in paths if indexes[p] is None]
+    have = perforce._have(to_query) if to_query != [] else {}
+    return {
+        p: (
+            indexes[p].is_perforced(p) if indexes[p] is not None
+            else have[p] is not None
+        )
+        for p in paths
+    }
+
+
+# Batchers of the per-path helpers using the default connection settings.
+# asyncio callers share the executor of the aio module.
+depot_paths = Batcher(perforce.get_depot_paths, executor=_executor)
+local_paths = Batcher(perforce.get_local_paths, executor=_executor)
+perforced = Batcher(_is_perforced, executor=_executor)
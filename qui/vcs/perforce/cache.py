@@ -0,0 +1,154 @@
+"""
+    Perforce query results cache.
+"""
+import threading
+import time
+
+from collections import OrderedDict
+from datetime import timedelta
+
+from . import stats
+
+
+MISSING = object()  # returned by Cache.get when nothing valid is cached
+
+
+class Cache(object):
+    """
+    Thread safe LRU cache with a per entry time to live.
+
+    Example
+    ```python
+    cache = Cache(max_size=2, ttl=60)
+    cache.set('//depot/a', {'depotFile': '//depot/a'})
+    result = cache.get('//depot/a', MISSING)
+    if result is MISSING:
+        ...
+    cache.invalidate_prefix('//depot/')
+    ```
+    """
+
+    def __init__(self, max_size=50000, ttl=None, name=None):
+        """
+        `max_size` is the maximum number of entries kept, the least recently
+        used entries are evicted first.
+        `ttl` is the default entry validity as seconds or datetime.timedelta,
+        None meaning entries never expire.
+        `name` identifies the cache in the stats registry.
+        """
+        self.name = name or 'cache'
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()  # key: (value, expiration_time or None)
+
+    @staticmethod
+    def _seconds(ttl):
+        return ttl.total_seconds() if isinstance(ttl, timedelta) else ttl
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__entries)
+
+    def __contains__(self, key):
+        return self.get(key, MISSING, count=False) is not MISSING
+
+    def get(self, key, default=None, count=True):
+        """
+        Return the value cached for `key` or `default` if there is none or
+        if it has expired.
+        Hit and miss counters are not updated if `count` is False.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[1] is not None:
+                if entry[1] <= time.monotonic():
+                    del self.__entries[key]
+                    self.expirations += 1
+                    entry = None
+
+            if entry is None:
+                if count is True:
+                    self.misses += 1
+
+            else:
+                self.__entries.move_to_end(key)
+                if count is True:
+                    self.hits += 1
+
+        if count is True and stats.enabled is True:
+            stats.registry.record_cache(self.name, entry is not None)
+
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl=MISSING):
+        """
+        Cache `value` for `key`, `ttl` overrides the cache default ttl.
+        """
+        ttl = self._seconds(self.ttl if ttl is MISSING else ttl)
+        expiration = time.monotonic() + ttl if ttl is not None else None
+        with self.__lock:
+            self.__entries[key] = (value, expiration)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def items(self):
+        """
+        Return the list of the (key, value) tuples not expired.
+        """
+        now = time.monotonic()
+        with self.__lock:
+            return [
+                (k, v) for k, (v, expiration) in self.__entries.items()
+                if expiration is None or expiration > now
+            ]
+
+    def invalidate(self, key):
+        """
+        Remove `key` from the cache.
+        """
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def invalidate_prefix(self, prefix):
+        """
+        Remove all the str keys starting with `prefix` from the cache.
+        Return the number of removed entries.
+        """
+        with self.__lock:
+            keys = [
+                k for k in self.__entries
+                if isinstance(k, str) and k.startswith(prefix)
+            ]
+            for k in keys:
+                del self.__entries[k]
+
+        return len(keys)
+
+    def clear(self):
+        """
+        Remove all the entries from the cache.
+        """
+        with self.__lock:
+            self.__entries.clear()
+
+    @property
+    def stats(self):
+        """
+        Return a dict with the cache counters.
+        """
+        with self.__lock:
+            return {
+                'size': len(self.__entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
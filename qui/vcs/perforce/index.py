@@ -0,0 +1,406 @@
+"""
+    In-memory have/opened index of a workspace subtree.
+
+Example
+```python
+from qui.vcs.perforce import index
+
+assets = index.WorkspaceIndex("//depot/project/assets")
+assets.load()  # one `p4 have` and one `p4 opened -a` call
+assets.is_perforced(filename), assets.is_opened(filename)
+for record in assets.opened(filename):
+    record['user'], record['client'], record['action']
+```
+"""
+import os
+import re
+import threading
+import time
+import weakref
+
+from P4 import P4
+
+from .. import perforce
+from . import server
+
+# Loaded WorkspaceIndex instances, consulted by `find`.
+_indexes = weakref.WeakSet()
+
+
+def path_key(path, case_sensitive=True):
+    """
+    Return the dict key of `path` (either local or perforce syntax),
+    lower cased if `case_sensitive` is False.
+    """
+    key = path if path[0:2] == "//" else os.path.normcase(os.path.realpath(path))
+    return key if case_sensitive is True else key.lower()
+
+
+def _settings(env=None, p4_adapter=None):
+    """
+    Return the (port, client) the commands run with `env` or `p4_adapter`
+    (see server.connect) are sent to, without connecting.
+    """
+    if p4_adapter is None:
+        p4_adapter = server.adapter_factory()
+        if env is not None:
+            server.apply_env(p4_adapter, env)
+
+    return p4_adapter.port, p4_adapter.client
+
+
+def find(path, env=None, p4_adapter=None):
+    """
+    Return a loaded WorkspaceIndex containing `path` and loaded from the
+    same server and client as `env` or `p4_adapter` (see server.connect),
+    None if there is none.
+    """
+    settings = None
+    for i in list(_indexes):
+        if i.contains(path) is True:
+            if settings is None:
+                settings = _settings(env=env, p4_adapter=p4_adapter)
+
+            if (i.port, i.client) == settings:
+                return i
+
+    return None
+
+
+def _strip_revision(path):
+    """
+    Return `path` without its revision specifier (ie. #head, @123).
+    """
+    return re.split('[#@]', path, 1)[0]
+
+
+def _wildcard_prefix(path):
+    """
+    Return the part of `path` before its first wildcard, None if it has
+    none.
+    """
+    positions = [path.find(w) for w in ('...', '*') if w in path]
+    return path[:min(positions)] if positions != [] else None
+
+
+def _flatten_paths(args):
+    ret = []
+    for a in args:
+        for p in (a if isinstance(a, (list, tuple)) else [a]):
+            # Flag values (ie. a changelist number) are not paths.
+            if isinstance(p, str) and not p.startswith('-') and (
+                    '/' in p or os.path.sep in p):
+                ret.append(p)
+
+    return ret
+
+
+def _command_listener(p4_adapter, command, args):
+    """
+    Mark the paths modified by the workspace commands run by qui as
+    outdated in the loaded indexes.
+    """
+    if command not in perforce._workspace_commands:
+        return
+
+    paths = [_strip_revision(p) for p in _flatten_paths(args)]
+    for i in list(_indexes):
+        if paths == []:
+            # ie. `p4 submit -c 123`, the modified files are unknown.
+            i.mark_outdated()
+
+        elif any(i._covered_by(p) for p in paths):
+            # ie. `p4 sync //depot/...#0` with the index under //depot.
+            i.mark_outdated()
+
+        elif any(i.contains(p) for p in paths):
+            i.mark_outdated([p for p in paths if i.contains(p) is True])
+
+
+server.command_listeners.append(_command_listener)
+
+
+class WorkspaceIndex(object):
+    """
+    Index of the `p4 have` and `p4 opened -a` results of the files under
+    `root`, answering "is perforced / is opened / by whom" with hash
+    lookups.
+    The index is refreshed incrementally when the server change counter
+    moves (polled at most every perforce.change_poll_interval) and when
+    qui runs a command modifying the workspace.
+    """
+
+    def __init__(self, root, case_sensitive=None, env=None):
+        """
+        `root` is a local or perforce directory.
+        `case_sensitive` defaults to the server case handling.
+        `env` is passed to server.connect (see its documentation).
+        """
+        self.root = root.rstrip('/\\')
+        self.case_sensitive = case_sensitive
+        self.env = env
+        self.loaded = False
+        # Server, client and user the index was loaded from.
+        self.port = None
+        self.client = None
+        self.user = None
+        self.__lock = threading.RLock()
+        self.__have = {}  # path_key: `p4 have` record (local and depot keys)
+        self.__opened = {}  # depot path_key: [`p4 opened -a` records]
+        self.__local_to_depot = {}  # local path_key of opened files: depot path
+        self.__change = None
+        self.__last_poll = None
+        self.__outdated = set()  # paths to query again
+        self.__reload = False
+        self.__roots = [root]  # root in the local and perforce syntaxes
+
+    def _key(self, path):
+        return path_key(path, case_sensitive=self.case_sensitive is not False)
+
+    def _prefix_key(self, prefix):
+        # Keep the trailing separator path_key removes from local paths.
+        key = self._key(prefix)
+        sep = '/' if key[0:2] == "//" else os.path.sep
+        if prefix.endswith(('/', os.path.sep)) and not key.endswith(sep):
+            key += sep
+
+        return key
+
+    def _covered_by(self, path):
+        """
+        Return True if the wildcard `path` matches the whole index root.
+        """
+        prefix = _wildcard_prefix(path)
+        if prefix is None:
+            return False
+
+        key = self._prefix_key(prefix)
+        return any(self._key(root).startswith(key) for root in self.__roots)
+
+    def _query(self):
+        sep = '/' if self.root[0:2] == "//" else os.path.sep
+        return "{}{}...".format(self.root, sep)
+
+    def contains(self, path):
+        """
+        Return True if `path` is under the index root.
+        """
+        key = self._key(path)
+        for root in self.__roots:
+            root = self._key(root)
+            if key.startswith(root + ('/' if root[0:2] == "//" else os.path.sep)):
+                return True
+
+        return False
+
+    def load(self, p4_adapter=None):
+        """
+        Fill the index with one `p4 have` and one `p4 opened -a` call.
+        """
+        with server.connect(env=self.env, p4_adapter=p4_adapter) as p4_adapter:
+            if self.case_sensitive is None:
+                self.case_sensitive = (
+                    p4_adapter.snapshot.info.get('caseHandling') != 'insensitive'
+                )
+
+            if self.root[0:2] == "//":
+                other_root = perforce.get_local_path(
+                    self.root + '/', p4_adapter=p4_adapter
+                )
+
+            else:
+                other_root = perforce.get_depot_path(
+                    os.path.join(os.path.realpath(self.root), ''),
+                    p4_adapter=p4_adapter
+                )
+
+            change = perforce.get_latest_change(p4_adapter=p4_adapter)
+            with p4_adapter.at_exception_level(P4.RAISE_NONE):
+                have = p4_adapter.run('have', self._query())
+                opened = p4_adapter.run('opened', '-a', self._query())
+
+            with self.__lock:
+                self.__have = {}
+                self.__opened = {}
+                self.__local_to_depot = {}
+                self.__add_have(have)
+                self.__add_opened(opened, p4_adapter)
+                self.__change = change
+                self.__last_poll = time.monotonic()
+                self.__outdated = set()
+                self.__reload = False
+                self.__roots = [self.root]
+                self.port = p4_adapter.port
+                self.client = p4_adapter.client
+                self.user = p4_adapter.user
+                if other_root is not None:
+                    self.__roots.append(other_root.rstrip('/\\'))
+
+                self.loaded = True
+
+        _indexes.add(self)
+
+    def __add_have(self, records):
+        for r in records:
+            self.__have[self._key(r['depotFile'])] = r
+            self.__have[self._key(r['path'])] = r
+
+    def __add_opened(self, records, p4_adapter):
+        for r in records:
+            self.__opened.setdefault(self._key(r['depotFile']), []).append(r)
+
+        # Files opened for add or by other clients have no have record.
+        missing = [
+            r['depotFile'] for r in records
+            if self._key(r['depotFile']) not in self.__have
+        ]
+        if missing != []:
+            local_paths = perforce.get_local_paths(missing, p4_adapter=p4_adapter)
+            for depot_path, local_path in local_paths.items():
+                if local_path is not None:
+                    self.__local_to_depot[self._key(local_path)] = depot_path
+
+    def mark_outdated(self, paths=None):
+        """
+        Query the `paths` again on next access, or the whole index if None.
+        """
+        with self.__lock:
+            if paths is None:
+                self.__reload = True
+
+            else:
+                self.__outdated.update(paths)
+
+    def refresh(self, force=False, p4_adapter=None):
+        """
+        Update the outdated entries, and the opened files and the files of
+        the changelists submitted since the last poll if the change counter
+        moved. The counter is polled if the last poll is older than
+        perforce.change_poll_interval or if `force` is True.
+        """
+        if self.loaded is False or self.__reload is True:
+            self.load(p4_adapter=p4_adapter)
+            return
+
+        with self.__lock:
+            poll = force is True or (
+                time.monotonic() - self.__last_poll
+                >= perforce.change_poll_interval.total_seconds()
+            )
+            if poll is False and not self.__outdated:
+                return
+
+            with server.connect(env=self.env, p4_adapter=p4_adapter) as p4_adapter:
+                outdated = set(self.__outdated)
+                self.__outdated = set()
+                refresh_opened = outdated != set()
+                if poll is True:
+                    change = perforce.get_latest_change(p4_adapter=p4_adapter)
+                    self.__last_poll = time.monotonic()
+                    if change != self.__change:
+                        # Our own submits (done outside qui) update the have list.
+                        with p4_adapter.at_exception_level(P4.RAISE_NONE):
+                            submitted = p4_adapter.run('files', "{}@{},@{}".format(
+                                self._query(), self.__change + 1, change
+                            ))
+
+                        outdated.update(f['depotFile'] for f in submitted)
+                        self.__change = change
+                        refresh_opened = True
+
+                if outdated:
+                    self.__update_have(outdated, p4_adapter)
+
+                if refresh_opened is True:
+                    with p4_adapter.at_exception_level(P4.RAISE_NONE):
+                        opened = p4_adapter.run('opened', '-a', self._query())
+
+                    self.__opened = {}
+                    self.__local_to_depot = {}
+                    self.__add_opened(opened, p4_adapter)
+
+    def __update_have(self, paths, p4_adapter):
+        query = set()
+        for path in paths:
+            path = _strip_revision(path)
+            query.add(path)
+            prefix = _wildcard_prefix(path)
+            if prefix is None:
+                records = [self.__have.get(self._key(path))]
+
+            else:
+                # The files no longer synced have no `p4 have` record.
+                key = self._prefix_key(prefix)
+                records = [r for k, r in self.__have.items() if k.startswith(key)]
+
+            for record in records:
+                if record is not None:
+                    self.__have.pop(self._key(record['depotFile']), None)
+                    self.__have.pop(self._key(record['path']), None)
+
+        with p4_adapter.at_exception_level(P4.RAISE_NONE):
+            self.__add_have(perforce.run_batched(p4_adapter, 'have', list(query)))
+
+    def have(self, path):
+        """
+        Return the `p4 have` record of `path` (local or perforce syntax),
+        None if it is not synced.
+        """
+        self.refresh()
+        with self.__lock:
+            return self.__have.get(self._key(path))
+
+    def is_perforced(self, path):
+        """
+        Return True if `path` is synced in the workspace, False otherwise.
+        """
+        return self.have(path) is not None
+
+    def local_path(self, path):
+        """
+        Return the local path of `path` as known by perforce (ie. with the
+        perforce case), None if it is not synced.
+        """
+        record = self.have(path)
+        return record['path'] if record is not None else None
+
+    def opened(self, path):
+        """
+        Return the list of the `p4 opened -a` records of `path` (local or
+        perforce syntax), one for each user/client having it opened.
+        """
+        self.refresh()
+        with self.__lock:
+            key = self._key(path)
+            if key[0:2] != "//":
+                record = self.__have.get(key)
+                depot_path = (
+                    record['depotFile'] if record is not None
+                    else self.__local_to_depot.get(key)
+                )
+                if depot_path is None:
+                    return []
+
+                key = self._key(depot_path)
+
+            return list(self.__opened.get(key, []))
+
+    def is_opened(self, path, by_others=False):
+        """
+        Return True if `path` is opened, by another user or client than
+        the current one if `by_others` is True.
+        """
+        records = self.opened(path)
+        if by_others is True:
+            records = [
+                r for r in records
+                if (r.get('user'), r.get('client')) != (self.user, self.client)
+            ]
+
+        return records != []
+
+    def opened_by(self, path):
+        """
+        Return the list of the users having `path` opened.
+        """
+        return [r['user'] for r in self.opened(path) if 'user' in r]
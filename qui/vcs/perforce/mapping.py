@@ -0,0 +1,121 @@
+"""
+    Offline client view mapping.
+
+Translate paths between the depot, client and local syntaxes using the
+client spec `View` (which already contains the stream view for stream
+clients) without asking the server, like `p4 where` would do.
+
+Example
+```python
+from qui.vcs.perforce import mapping, server
+
+with server.connect() as p4:
+    view = mapping.ClientViewMapping.from_adapter(p4)
+
+result = view.where("//depot/dir/file.ma")
+if result is mapping.AMBIGUOUS:
+    ...  # Ask the server
+```
+"""
+import os
+
+from P4 import Map
+
+
+AMBIGUOUS = object()  # returned when only the server can answer
+
+# Characters escaped or interpreted in perforce syntax.
+_special_characters = ('@', '#', '%', '*', '...')
+
+
+class ClientViewMapping(object):
+    """
+    In-process `p4 where` based on the client spec view.
+    """
+
+    def __init__(self, client_spec, case_sensitive=True):
+        """
+        `client_spec` is a client spec dict as returned by `p4 client -o`.
+        `case_sensitive` should be False for case insensitive servers.
+        """
+        self.client = client_spec['Client']
+        self.root = client_spec.get('Root', 'null')
+        self.update = client_spec.get('Update')  # to detect client spec edits
+        self.case_sensitive = case_sensitive
+        view = client_spec.get('View', [])
+        # Overlay (+) and ditto (&) mappings can map a path several times,
+        # alternate / null roots depend on the client host.
+        self.is_ambiguous = (
+            self.root == 'null' or
+            'AltRoots' in client_spec or
+            any(line.lstrip('"').startswith(('+', '&')) for line in view)
+        )
+        self.map = Map(view)
+        self.client_prefix = "//{}/".format(self.client)
+        self.local_root = os.path.join(os.path.abspath(self.root), '')
+
+    @classmethod
+    def from_adapter(cls, p4_adapter):
+        """
+        Return a ClientViewMapping built from the connected `p4_adapter`.
+        """
+        return cls(
+            p4_adapter.snapshot.client_spec,
+            case_sensitive=(
+                p4_adapter.snapshot.info.get('caseHandling') != 'insensitive'
+            ),
+        )
+
+    def _client_to_local(self, client_path):
+        return os.path.join(
+            self.local_root,
+            *client_path[len(self.client_prefix):].split('/')
+        )
+
+    def _local_to_client(self, local_path):
+        local_path = os.path.abspath(local_path)
+        if not os.path.normcase(local_path).startswith(
+                os.path.normcase(self.local_root)):
+            return None
+
+        return self.client_prefix + '/'.join(
+            local_path[len(self.local_root):].split(os.path.sep)
+        )
+
+    def where(self, path):
+        """
+        Return a dict with the 'depotFile', 'clientFile' and 'path' keys
+        as `p4 where` does for `path` (either local, client or depot syntax),
+        None if `path` is not mapped or AMBIGUOUS if the server must be
+        asked instead.
+        """
+        if self.is_ambiguous is True:
+            return AMBIGUOUS
+
+        if any(c in path for c in _special_characters):
+            return AMBIGUOUS
+
+        if path[0:2] != "//":
+            client_path = self._local_to_client(path)
+            depot_path = (
+                self.map.translate(client_path, 0)
+                if client_path is not None else None
+            )
+
+        elif path.startswith(self.client_prefix):
+            client_path = path
+            depot_path = self.map.translate(client_path, 0)
+
+        else:
+            depot_path = path
+            client_path = self.map.translate(depot_path)
+
+        if depot_path is None or client_path is None:
+            # Could be a case mismatch only the server knows how to solve.
+            return None if self.case_sensitive is True else AMBIGUOUS
+
+        return {
+            'depotFile': depot_path,
+            'clientFile': client_path,
+            'path': self._client_to_local(client_path),
+        }
@@ -0,0 +1,155 @@
+"""
+    Compact records of tagged perforce results.
+"""
+import sys
+
+
+def _split_path(path):
+    """
+    Return the (interned directory, basename) tuple of `path`, so the
+    directories shared by many files are only stored once.
+    """
+    i = max(path.rfind('/'), path.rfind('\\')) + 1
+    return sys.intern(path[:i]), path[i:]
+
+
+class FileStat(object):
+    """
+    Memory friendly `p4 fstat` record with a read only dict-like access.
+    Revision, change and time fields are stored as int, repeated values
+    (actions, types, users, directories) are interned, unknown fields are
+    kept as is.
+
+    Example
+    ```python
+    record = FileStat.from_dict(p4.run('fstat', filename)[0])
+    record['depotFile'], record.get('haveRev', -1), dict(record)
+    ```
+    """
+    # Fields stored in their own slot.
+    int_fields = (
+        'haveRev', 'headChange', 'headModTime', 'headRev', 'headTime',
+        'fileSize',
+    )
+    str_fields = (
+        'action', 'actionOwner', 'change', 'headAction', 'headType', 'type',
+        'workRev', 'ourLock', 'isMapped',
+    )
+    list_fields = ('otherAction', 'otherChange', 'otherOpen')
+    path_fields = ('depotFile', 'clientFile')
+    __slots__ = (
+        ('_depot_dir', '_depot_name', '_client_dir', '_client_name', '_extra') +
+        int_fields + str_fields + list_fields
+    )
+
+    def __init__(self, **fields):
+        self._depot_dir = self._depot_name = None
+        self._client_dir = self._client_name = None
+        self._extra = None
+        for k in self.int_fields + self.str_fields + self.list_fields:
+            setattr(self, k, None)
+
+        for k, v in fields.items():
+            self._set(k, v)
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Return a FileStat from the tagged result dict `d`.
+        """
+        return cls(**d)
+
+    def _set(self, key, value):
+        if key == 'depotFile':
+            self._depot_dir, self._depot_name = _split_path(value)
+
+        elif key == 'clientFile':
+            self._client_dir, self._client_name = _split_path(value)
+
+        elif key in self.int_fields:
+            try:
+                setattr(self, key, int(value))
+
+            except ValueError:
+                setattr(self, key, sys.intern(value))
+
+        elif key in self.str_fields:
+            setattr(self, key, sys.intern(value))
+
+        elif key in self.list_fields:
+            setattr(self, key, tuple(sys.intern(v) for v in value))
+
+        else:
+            if self._extra is None:
+                self._extra = {}
+
+            self._extra[sys.intern(key)] = value
+
+    def __getitem__(self, key):
+        if key == 'depotFile':
+            value = (
+                self._depot_dir + self._depot_name
+                if self._depot_dir is not None else None
+            )
+
+        elif key == 'clientFile':
+            value = (
+                self._client_dir + self._client_name
+                if self._client_dir is not None else None
+            )
+
+        elif key in self.__slots__ and not key.startswith('_'):
+            value = getattr(self, key)
+
+        else:
+            value = self._extra.get(key) if self._extra is not None else None
+
+        if value is None:
+            raise KeyError(key)
+
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        ret = [
+            k for k in
+            self.path_fields + self.int_fields + self.str_fields + self.list_fields
+            if k in self
+        ]
+        if self._extra is not None:
+            ret += list(self._extra)
+
+        return ret
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (FileStat, dict)):
+            return self.to_dict() == dict(other)
+
+        return NotImplemented
+
+    def __repr__(self):
+        return "FileStat({})".format(repr(self.to_dict()))
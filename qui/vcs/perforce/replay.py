@@ -0,0 +1,320 @@
+"""
+    Record / replay of perforce commands results.
+
+Allows to run and benchmark the perforce helpers and widgets without
+a server, with a deterministic configurable latency.
+
+Example
+```python
+from qui.vcs.perforce import replay, server
+
+# Record the results of a real session ...
+recording = replay.Recording()
+server.adapter_factory = lambda: replay.RecordingP4Adapter(recording)
+my_tool()
+recording.save("my_tool.json")
+
+# ... and replay them anywhere.
+recording = replay.Recording.load("my_tool.json")
+server.adapter_factory = lambda: replay.ReplayP4Adapter(recording, latency=0.02)
+server.pool.clear()
+my_tool()
+```
+"""
+import contextlib
+import copy
+import json
+import os
+import threading
+import time
+
+from P4 import (
+    OutputHandler,
+    P4Exception,
+)
+
+from . import (
+    server,
+    stats,
+)
+
+# Commands whose results can be split by file, so a multi-path command
+# can be replayed from the results of commands on other paths.
+file_commands = {'fstat', 'files', 'have', 'opened', 'sync', 'where'}
+# Flags taking a value.
+_value_flags = {'-c', '-e', '-F', '-m', '-S', '-s', '-T', '-u'}
+
+
+def _flatten(args):
+    ret = []
+    for a in args:
+        if isinstance(a, (list, tuple)):
+            ret += [str(x) for x in a]
+
+        else:
+            ret.append(str(a))
+
+    return ret
+
+
+def _split_args(args):
+    """
+    Return the (flags, paths) lists of the flattened command `args`
+    (command name excluded).
+    """
+    flags, paths = [], []
+    expect_value = False
+    for a in args:
+        if expect_value is True:
+            flags.append(a)
+            expect_value = False
+
+        elif a.startswith('-'):
+            flags.append(a)
+            expect_value = a in _value_flags
+
+        else:
+            paths.append(a)
+
+    return flags, paths
+
+
+def _path_key(path):
+    if path[0:2] == "//":
+        return path
+
+    return os.path.normcase(os.path.abspath(path))
+
+
+class Recording(object):
+    """
+    Recorded commands results, indexed by exact command and by file.
+    """
+
+    def __init__(self, settings=None, commands=None, files=None):
+        """
+        `settings` is a dict with the recorded adapter settings
+        (port, user, client...).
+        """
+        self.settings = settings or {}
+        self.commands = commands or {}  # json(args): [records]
+        self.files = files or {}  # json([command] + flags): {path: [records]}
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            return cls(**json.load(f))
+
+    def save(self, filename):
+        with self.__lock:
+            data = {
+                'settings': self.settings,
+                'commands': self.commands,
+                'files': self.files,
+            }
+            with open(filename, 'w') as f:
+                json.dump(data, f)
+
+    def add(self, args, result):
+        """
+        Record the `result` list of the command `args`.
+        """
+        args = _flatten(args)
+        result = [r for r in result if isinstance(r, dict)]
+        with self.__lock:
+            self.commands[json.dumps(args)] = result
+            if args[0] not in file_commands:
+                return
+
+            flags, _ = _split_args(args[1:])
+            files = self.files.setdefault(json.dumps([args[0]] + flags), {})
+            for r in result:
+                keys = set(
+                    _path_key(r[k]) for k in ('depotFile', 'clientFile', 'path')
+                    if k in r
+                )
+                for k in keys:
+                    records = files.setdefault(k, [])
+                    if r not in records:
+                        records.append(r)
+
+    def find(self, args):
+        """
+        Return the list of recorded records for the command `args`,
+        None if it cannot be answered from the recording.
+        """
+        args = _flatten(args)
+        with self.__lock:
+            result = self.commands.get(json.dumps(args))
+            if result is not None or args[0] not in file_commands:
+                return result
+
+            flags, paths = _split_args(args[1:])
+            files = self.files.get(json.dumps([args[0]] + flags))
+            if files is None:
+                return None
+
+            ret = []
+            for p in paths:
+                for r in files.get(_path_key(p), []):
+                    if r not in ret:
+                        ret.append(r)
+
+            return ret
+
+
+class RecordingP4Adapter(server.CustomP4Adapter):
+    """
+    CustomP4Adapter recording the results of the commands it runs.
+    """
+
+    def __init__(self, recording):
+        super(RecordingP4Adapter, self).__init__()
+        self.__dict__['recording'] = recording
+
+    def run(self, *args, **kwargs):
+        result = super(RecordingP4Adapter, self).run(*args, **kwargs)
+        recording = self.__dict__['recording']
+        if recording.settings == {}:
+            recording.settings.update({
+                'port': self.port, 'user': self.user, 'client': self.client,
+            })
+
+        recording.add(args, result)
+        return result
+
+
+class ReplayP4Adapter(object):
+    """
+    Adapter with the CustomP4Adapter interface answering the commands from
+    a Recording, without any server.
+    """
+    RAISE_NONE = 0
+    RAISE_ERROR = 1
+    RAISE_ALL = 2
+
+    def __init__(self, recording, latency=0.0, latency_per_record=0.0):
+        """
+        `latency` is the number of seconds each command takes, plus
+        `latency_per_record` seconds per returned record.
+        """
+        self.recording = recording
+        self.latency = latency
+        self.latency_per_record = latency_per_record
+        self.port = recording.settings.get('port', 'replay:1666')
+        self.user = recording.settings.get('user', 'replay')
+        self.client = recording.settings.get('client', 'replay')
+        self.password = recording.settings.get('password', '')
+        self.cwd = os.getcwd()
+        self.charset = 'none'
+        self.api_level = recording.settings.get('api_level', 0)
+        self.server_level = recording.settings.get('server_level', 0)
+        self.exception_level = self.RAISE_ALL
+        self.handler = None
+        self.warnings = []
+        self.errors = []
+        self.with_scope_count = 0
+        self.pool = None
+        self.lock = threading.RLock()
+        self.snapshot = server.SessionSnapshot(self)
+        self.__connected = False
+
+    def env(self, name):
+        return None
+
+    def connect(self):
+        if self.latency > 0.0:
+            time.sleep(self.latency)
+
+        self.__connected = True
+        return self
+
+    def disconnect(self):
+        self.__connected = False
+
+    def connected(self):
+        return self.__connected
+
+    @contextlib.contextmanager
+    def at_exception_level(self, level):
+        old_level, self.exception_level = self.exception_level, level
+        try:
+            yield self
+
+        finally:
+            self.exception_level = old_level
+
+    @contextlib.contextmanager
+    def using_handler(self, handler):
+        old_handler, self.handler = self.handler, handler
+        try:
+            yield self
+
+        finally:
+            self.handler = old_handler
+
+    def run(self, *args, **kwargs):
+        start = time.perf_counter()
+        self.warnings, self.errors = [], []
+        result = self.recording.find(args)
+        if result is None:
+            self.errors.append("No recorded result for {}.".format(repr(args)))
+            if self.exception_level >= self.RAISE_ERROR:
+                raise P4Exception(self.errors[0])
+
+            result = []
+
+        result = copy.deepcopy(result)
+        delay = self.latency + self.latency_per_record * len(result)
+        if delay > 0.0:
+            time.sleep(delay)
+
+        handler = kwargs.get('handler', self.handler)
+        if handler is not None:
+            reported = []
+            for r in result:
+                status = handler.outputStat(r)
+                if status == OutputHandler.REPORT:
+                    reported.append(r)
+
+                elif status == OutputHandler.CANCEL:
+                    break
+
+            result = reported
+
+        if stats.enabled is True and args:
+            stats.registry.record_command(
+                args[0], len(_flatten(args[1:])),
+                time.perf_counter() - start, len(result)
+            )
+
+        if args and server.command_listeners:
+            for listener in list(server.command_listeners):
+                listener(self, args[0], args[1:])
+
+        return result
+
+    def __getattr__(self, name):
+        if name.startswith('run_'):
+            return lambda *args, **kwargs: self.run(name[4:], *args, **kwargs)
+
+        if name.startswith('fetch_'):
+            return lambda *args: self.run(name[6:], '-o', *args)[0]
+
+        raise AttributeError(name)
+
+    def __enter__(self):
+        self.with_scope_count += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.with_scope_count -= 1
+        if self.with_scope_count <= 0:
+            if self.pool is not None:
+                self.pool.release(self)
+
+            else:
+                self.disconnect()
+
+        return False
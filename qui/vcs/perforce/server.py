@@ -2,9 +2,24 @@
     Perforce server stuff
 """
 
+import os
+import threading
+import time
+import weakref
+
 from P4 import P4
 
+from . import stats
+
 debug = False
+pooling = True  # reuse the connections created by `connect` through `pool`
+# Number of seconds the SessionSnapshot `p4 info` result and client spec
+# are trusted before being queried again.
+snapshot_timeout = 60.0
+
+# Functions called as listener(p4_adapter, command, args) after each
+# CustomP4Adapter.run call, successful or not.
+command_listeners = []
 
 
 class CustomP4Adapter(P4):
@@ -15,6 +30,10 @@ class CustomP4Adapter(P4):
 
     def __init__(self):
         self.__dict__['with_scope_count'] = 0
+        self.__dict__['pool'] = None  # ConnectionPool owning the connection
+        # To serialize the commands sent from several threads.
+        self.__dict__['lock'] = threading.RLock()
+        self.__dict__['snapshot'] = SessionSnapshot(self)
         super().__init__()
 
     def increment_scope_count(self):
@@ -23,6 +42,31 @@ class CustomP4Adapter(P4):
     def decrement_scope_count(self):
         self.__dict__['with_scope_count'] -= 1
 
+    def run(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = None
+        try:
+            result = super().run(*args, **kwargs)
+            return result
+
+        finally:
+            if stats.enabled is True and args:
+                stats.registry.record_command(
+                    args[0],
+                    sum(len(a) if isinstance(a, (list, tuple)) else 1
+                        for a in args[1:]),
+                    time.perf_counter() - start,
+                    len(result) if isinstance(result, list) else 0,
+                )
+
+            if args and args[0] in ('client', 'workspace') and (
+                    '-i' in args or '-d' in args or '-s' in args):
+                self.__dict__['snapshot'].refresh()
+
+            if args and command_listeners:
+                for listener in list(command_listeners):
+                    listener(self, args[0], args[1:])
+
     def __enter__(self):
         self.increment_scope_count()
         if debug is True:
@@ -36,12 +80,325 @@ class CustomP4Adapter(P4):
             print("DBG - Scope Exit", self.__dict__, self)
 
         if self.__dict__['with_scope_count'] <= 0:
+            if self.__dict__['pool'] is not None:
+                if debug is True:
+                    print("DBG - Releasing connection", self)
+
+                self.__dict__['pool'].release(self)
+                return False
+
             if debug is True:
                 print("DBG - Closing connection", self)
 
             return super().__exit__(exc_type, exc_val, exc_tb)
 
 
+class SessionSnapshot(object):
+    """
+    Lazily filled snapshot of the `p4 info` result, the client spec and the
+    server level of a CustomP4Adapter, to avoid querying them over and over.
+    It is refreshed when the adapter port/user/client change, when the
+    adapter runs a `client` command or on demand with `refresh`.
+    The `p4 info` result and the client spec are also queried again after
+    `snapshot_timeout` seconds, so changes made outside qui are seen by the
+    long lived pooled connections, the client view being rebuilt only if
+    the client spec `Update` field changed.
+
+    Example
+    ```python
+    with server.connect() as p4:
+        p4.snapshot.client_root  # `p4 info` is run once per connection
+    ```
+    """
+
+    def __init__(self, adapter):
+        self.__adapter = weakref.ref(adapter)
+        self.__lock = threading.RLock()
+        self.__key = None
+        self.__values = {}
+
+    def __get(self, name, func, expires=True):
+        adapter = self.__adapter()
+        with self.__lock:
+            key = (adapter.port, adapter.user, adapter.client)
+            if key != self.__key:
+                self.__values.clear()
+                self.__key = key
+
+            entry = self.__values.get(name)  # (value, monotonic query time)
+            if entry is not None and expires is True and (
+                    time.monotonic() - entry[1] >= snapshot_timeout):
+                entry = None
+
+            if entry is None:
+                entry = self.__values[name] = (func(adapter), time.monotonic())
+
+            return entry[0]
+
+    def refresh(self):
+        """
+        Forget the snapshot values, they are queried again on next access.
+        """
+        with self.__lock:
+            self.__values.clear()
+
+    @property
+    def info(self):
+        """
+        `p4 info` result dict.
+        """
+        return self.__get('info', lambda a: a.run('info')[0])
+
+    @property
+    def client_spec(self):
+        """
+        Current client spec dict.
+        """
+        return self.__get('client_spec', lambda a: a.fetch_client())
+
+    @property
+    def server_level(self):
+        """
+        Server API level.
+        """
+        return self.__get('server_level', lambda a: a.server_level, expires=False)
+
+    @property
+    def client_view(self):
+        """
+        mapping.ClientViewMapping of the current client.
+        """
+        from . import mapping
+        build = mapping.ClientViewMapping.from_adapter
+        with self.__lock:
+            update = self.client_spec.get('Update')
+            view = self.__get('client_view', build, expires=False)
+            if view.update != update:
+                self.__values.pop('client_view', None)
+                view = self.__get('client_view', build, expires=False)
+
+            return view
+
+    @property
+    def client_root(self):
+        """
+        Real path of the client root, None if there is no client.
+        """
+        root = self.info.get('clientRoot')
+        return os.path.realpath(root) if root is not None else None
+
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of idle connected CustomP4Adapter.
+    Connections are keyed by all the settings `apply_env` can set, a
+    connection is checked out by `acquire` and given back by `release`
+    (which is done by CustomP4Adapter when its last with scope exits).
+    The per-caller settings (`reset_attributes`) changed while a
+    connection is checked out are restored when it is given back.
+    """
+    # Adapter attributes restored to their connection time value on release.
+    reset_attributes = ('exception_level', 'handler', 'tagged', 'cwd', 'prog')
+
+    def __init__(self, max_size=8, idle_timeout=300.0, health_check_delay=30.0):
+        """
+        `max_size` is the maximum number of idle connections kept.
+        Note: The checked out connections are not limited, their number
+        depends on the callers (see perforce.fan_out_max_workers and
+        aio.max_workers for the helpers running commands in parallel).
+        `idle_timeout` is the number of seconds after which an idle
+        connection is closed.
+        `health_check_delay` is the number of seconds a connection can stay
+        idle before being checked with a round trip to the server on reuse.
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_delay = health_check_delay
+        self.__lock = threading.Lock()
+        self.__idle = []  # [(key, adapter, release_time)], oldest first
+
+    @staticmethod
+    def key(adapter):
+        """
+        Return the pool key of `adapter`, the values of all the connection
+        settings (see `_env_attributes`) so an idle connection is only reused
+        for the same environment overrides.
+        """
+        return tuple(
+            (a, getattr(adapter, a, None))
+            for a in sorted(set(_env_attributes.values()))
+        )
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__idle)
+
+    def acquire(self, adapter):
+        """
+        Return a healthy idle connection with the same settings as the
+        not yet connected `adapter`, or `adapter` itself once connected
+        if there is none.
+        """
+        key = self.key(adapter)
+        while True:
+            with self.__lock:
+                expired = self.__pop_expired()
+                candidate = None
+                for i, (k, a, t) in enumerate(reversed(self.__idle)):
+                    if k == key:
+                        candidate = a, t
+                        del self.__idle[len(self.__idle) - 1 - i]
+                        break
+
+            self.__disconnect(expired)
+            if candidate is None:
+                break
+
+            if self.__is_healthy(*candidate) is True:
+                if debug is True:
+                    print("DBG - Reusing pooled connection", candidate[0])
+
+                if stats.enabled is True:
+                    stats.registry.record_connection(reused=True)
+
+                # Relative paths resolve against the current directory, as
+                # with a new connection, not the one it was opened in.
+                if candidate[0].cwd != adapter.cwd:
+                    candidate[0].cwd = adapter.cwd
+
+                return candidate[0]
+
+            self.__disconnect([candidate[0]])
+
+        adapter.connect()
+        adapter.__dict__['pool'] = self
+        adapter.__dict__['defaults'] = {
+            a: getattr(adapter, a)
+            for a in self.reset_attributes if hasattr(adapter, a)
+        }
+        if stats.enabled is True:
+            stats.registry.record_connection(reused=False)
+
+        return adapter
+
+    def release(self, adapter):
+        """
+        Give back the connected `adapter` to the pool.
+        """
+        if adapter.connected() is False:
+            return
+
+        try:
+            for a, value in adapter.__dict__.get('defaults', {}).items():
+                if getattr(adapter, a) != value:
+                    setattr(adapter, a, value)
+
+        except Exception:
+            # Not reusable if its state cannot be restored.
+            self.__disconnect([adapter])
+            return
+
+        with self.__lock:
+            expired = self.__pop_expired()
+            self.__idle.append((self.key(adapter), adapter, time.monotonic()))
+            while len(self.__idle) > self.max_size:
+                expired.append(self.__idle.pop(0)[1])
+
+        self.__disconnect(expired)
+
+    def clear(self):
+        """
+        Close all the idle connections.
+        """
+        with self.__lock:
+            idle = [a for _, a, _ in self.__idle]
+            self.__idle = []
+
+        self.__disconnect(idle)
+
+    def __pop_expired(self):
+        # Must be called with the lock held.
+        limit = time.monotonic() - self.idle_timeout
+        expired = [a for _, a, t in self.__idle if t < limit]
+        self.__idle = [e for e in self.__idle if e[2] >= limit]
+        return expired
+
+    def __is_healthy(self, adapter, release_time):
+        if adapter.connected() is False:
+            return False
+
+        if time.monotonic() - release_time < self.health_check_delay:
+            return True
+
+        try:
+            adapter.run('info', '-s')
+
+        except Exception:
+            return False
+
+        return True
+
+    @staticmethod
+    def __disconnect(adapters):
+        for a in adapters:
+            a.__dict__['pool'] = None
+            try:
+                if a.connected() is True:
+                    a.disconnect()
+
+            except Exception:
+                pass
+
+
+pool = ConnectionPool()
+# Callable returning the not yet connected adapters created by `connect`.
+# (ie. replay.ReplayP4Adapter to run without a server)
+adapter_factory = CustomP4Adapter
+
+
+# Environment variables applied as adapter attributes.
+_env_attributes = {
+    'P4CHARSET': 'charset',
+    'P4CLIENT': 'client',
+    'P4HOST': 'host',
+    'P4IGNORE': 'ignore_file',
+    'P4LANGUAGE': 'language',
+    'P4PASSWD': 'password',
+    'P4PORT': 'port',
+    'P4TICKETS': 'ticket_file',
+    'P4TRUST': 'trust_file',
+    'P4USER': 'user',
+}
+# Keys of perforce.current_configuration_dict not related to the connection.
+_ignored_env_keys = {
+    'api_level', 'connected', 'cwd', 'editor', 'server_level',
+    'P4CONFIG', 'P4EDITOR', 'P4ROOT',
+}
+
+
+def apply_env(adapter, env):
+    """
+    Apply the `env` environment variable overrides (see `connect`) to the
+    not yet connected `adapter` attributes, without modifying os.environ.
+    Note: Values not overridden still come from the process environment
+    and P4CONFIG files.
+    """
+    for k, v in env.items():
+        if k in _ignored_env_keys:
+            continue
+
+        attribute = _env_attributes.get(k)
+        # Try to be friendly with dict returned from perforce.current_configuration_dict
+        if k in ['client', 'password', 'port', 'user']:
+            attribute = k
+
+        if attribute is None:
+            print("WRN - Ignoring unsupported perforce setting {}.".format(repr(k)))
+            continue
+
+        setattr(adapter, attribute, v)
+
+
 def connect(env=None, p4_adapter=None):
     """
     Return a P4 adapter.
@@ -53,6 +410,15 @@ def connect(env=None, p4_adapter=None):
     `p4_adapter` is an already existing P4 adapter or None.
     If it is NOT None it is returned by the function after ensuring it is
     connected.
+
+    # Update:
+    `env` overrides are applied to the adapter (see `apply_env`) instead of
+    os.environ, so connections with different environments can be created
+    concurrently from several threads.
+    If `p4_adapter` is None and `pooling` is True, an idle connection with
+    the same settings is taken from `pool` instead of doing a new
+    connect/login handshake. It goes back to the pool when its last
+    with scope exits.
     Note:
     It is done to more easily reuse existing connections with the python 'with'
     statement.
@@ -76,7 +442,6 @@ def connect(env=None, p4_adapter=None):
                     return p4.run('info')
     """
     global debug
-    import os
 
     if p4_adapter is not None:
         if p4_adapter.connected() is False:
@@ -87,63 +452,23 @@ def connect(env=None, p4_adapter=None):
 
         return p4_adapter
 
-    backup_env = {}
+    adapter = adapter_factory()  # CustomP4Adapter() by default
     if env is not None:
-        env = dict(env)  # make a copy
-        if 'P4CONFIG' in os.environ:
-            backup_env['P4CONFIG'] = os.environ['P4CONFIG']
-            del os.environ['P4CONFIG']
-
-        if 'P4ROOT' in os.environ:
-            backup_env['P4ROOT'] = os.environ['P4ROOT']
-            del os.environ['P4ROOT']
-
-        for k, v in dict(env).items():
-            # Try to be friendly with dict returned from perforce.current_configuration_dict
-            if k in ['api_level',
-                     'client',
-                     'connected',
-                     'cwd',
-                     'editor',
-                     'password',
-                     'port',
-                     'server_level',
-                     'user',]:
-                # ignore these values
-                if k in ['api_level', 'connected', 'cwd', 'server_level']:
-                    del env[k]
-                    continue
-
-                del env[k]
-                k = str("P4{}".format(k.upper()))
-                env[k] = v
-
-            if k in os.environ:  # Make a backup of the value f necessary
-                backup_env[k] = os.environ[k]
-
-            os.environ[k] = v
-
-    adapter = CustomP4Adapter()  # P4()
+        apply_env(adapter, env)
+
     # adapter.exception_level = 0 ???????? use the default for the moment ...
-    adapter.connect()
     # BUGFixing API HACK
     # DO NOT REMOVE THE CODE LINE BELOW:
     # P4USER and P4CLIENT values are not fixed in the adapter yet and therefore
     # does not contain the current environment ...
     adapter.user, adapter.client
     # ... and now they are.
-    if backup_env != {}:  # cleaning env and restoring values if necessary
-        for k in env:
-            if k in backup_env:
-                os.environ[k] = backup_env[k]
-
-            else:
-                del os.environ[k]
-
-        if 'P4ROOT' in backup_env:
-            os.environ[str('P4ROOT')] = backup_env['P4ROOT']
+    if pooling is True:
+        adapter = pool.acquire(adapter)
 
-        if 'P4CONFIG' in backup_env:
-            os.environ[str('P4CONFIG')] = backup_env['P4CONFIG']
+    else:
+        adapter.connect()
+        if stats.enabled is True:
+            stats.registry.record_connection(reused=False)
 
     return adapter
@@ -0,0 +1,150 @@
+"""
+    Cached perforce session of the current user.
+"""
+import threading
+import traceback
+
+from PySide6 import QtCore
+
+from .. import perforce
+from . import server
+
+
+class CurrentUser(QtCore.QObject):
+    """
+    Utility class for contextual metas retrieval based on
+    the current perforce user.
+    User, client and pending changelists are fetched once and kept until
+    `refresh` is called, or until the server change counter moves if
+    `check_for_changes` is called (see `start_polling`).
+    The `changed` signal is emitted when a refresh gets different values.
+
+    Example
+    ```python
+    user = CurrentUser()
+    user.changed.connect(widget.update_changelists_slot)
+    user.start_polling(10000)
+    user.pending_changelist_numbers  # no server round trip
+    ```
+    """
+    changed = QtCore.Signal()
+
+    def __init__(self, env=None, parent=None):
+        """
+        `env` is passed to server.connect (see its documentation).
+        """
+        super(CurrentUser, self).__init__(parent=parent)
+        self.env = env
+        self.__lock = threading.RLock()
+        self.__values = None
+        self.__change = None
+        self.__stop_event = None
+
+    def refresh(self, p4_adapter=None):
+        """
+        Fetch the session values again, emit `changed` and return True
+        if they are different, return False otherwise.
+        """
+        with server.connect(env=self.env, p4_adapter=p4_adapter) as p4_adapter:
+            change = perforce.get_latest_change(p4_adapter=p4_adapter)
+            values = {
+                'login': p4_adapter.user,
+                'client': p4_adapter.client,
+                'pending_changelists': (
+                    perforce.get_current_user_pending_changelists(
+                        p4_adapter=p4_adapter
+                    )
+                ),
+            }
+
+        with self.__lock:
+            is_changed = values != self.__values
+            self.__values = values
+            self.__change = change
+
+        if is_changed is True:
+            self.changed.emit()
+
+        return is_changed
+
+    def check_for_changes(self, p4_adapter=None):
+        """
+        Refresh the session values if the server change counter moved since
+        the last refresh, return True if the values changed.
+        Note: Editing a pending changelist description does not move the
+        change counter, call `refresh` for that.
+        """
+        with server.connect(env=self.env, p4_adapter=p4_adapter) as p4_adapter:
+            change = perforce.get_latest_change(p4_adapter=p4_adapter)
+            if change == self.__change:
+                return False
+
+            return self.refresh(p4_adapter=p4_adapter)
+
+    def start_polling(self, interval=10000):
+        """
+        Call `check_for_changes` every `interval` milliseconds from a worker
+        thread, so the server round trips do not block the event loop
+        (`changed` is delivered in the thread of its receivers).
+        """
+        self.stop_polling()
+        self.__stop_event = threading.Event()
+        threading.Thread(
+            target=self.__poll, args=(interval / 1000.0, self.__stop_event),
+            name="qui-p4-session", daemon=True
+        ).start()
+
+    def stop_polling(self):
+        if self.__stop_event is not None:
+            self.__stop_event.set()
+            self.__stop_event = None
+
+    def __poll(self, interval, stop_event):
+        while stop_event.wait(interval) is False:
+            try:
+                self.check_for_changes()
+
+            except Exception:
+                traceback.print_exc()
+
+    def __get(self, name):
+        with self.__lock:
+            if self.__values is None:
+                self.refresh()
+
+            return self.__values[name]
+
+    @property
+    def login(self):
+        """
+        Current perforce user name.
+        """
+        return self.__get('login')
+
+    @property
+    def client(self):
+        """
+        Current perforce client name.
+        """
+        return self.__get('client')
+
+    @property
+    def pending_changelist_numbers(self):
+        """
+        Current user pending changelists numbers.
+        """
+        return [c['change'] for c in self.__get('pending_changelists')]
+
+    @property
+    def pending_changelists(self):
+        """
+        Current user pending changelists.
+        """
+        return list(self.__get('pending_changelists'))
+
+    def has_pending_changelist(self, changelist_number):
+        """
+        Return True if `changelist_number` is in current user pending CL list
+        False otherwise.
+        """
+        return str(changelist_number) in self.pending_changelist_numbers
@@ -0,0 +1,153 @@
+"""
+    Coalescing of identical concurrent requests.
+
+Example
+```python
+from qui.vcs.perforce import singleflight
+
+group = singleflight.Group()
+# Threads asking for the same key while a call is in flight wait for it
+# instead of running `func` again.
+info = group.do(('info',), func)
+```
+"""
+import asyncio
+import copy
+import functools
+import threading
+
+from . import stats
+
+
+def freeze(value):
+    """
+    Return a hashable version of `value` made of (nested) dicts, lists,
+    sets and hashable values.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(v) for v in value)
+
+    return value
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Flight(object):
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class Group(object):
+    """
+    Run a single call per key at a time, the callers asking for a key
+    already in flight (from other threads or asyncio tasks) get the result
+    or the exception of this call.
+    Followers get a deep copy of the result so they can modify it safely.
+    """
+
+    def __init__(self, name='single_flight'):
+        """
+        `name` identifies the group in the stats registry, where the shared
+        results are recorded as cache hits.
+        """
+        self.name = name
+        self.__lock = threading.Lock()
+        self.__calls = {}  # key: _Call
+        self.__flights = {}  # (loop, key): _Flight
+
+    def __record(self, shared):
+        if stats.enabled is True:
+            stats.registry.record_cache(self.name, shared)
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Return `func(*args, **kwargs)`, or the result of the identical call
+        with the same hashable `key` already running in another thread.
+        """
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader is True:
+                call = self.__calls[key] = _Call()
+
+        self.__record(leader is False)
+        if leader is False:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+
+        except BaseException as e:
+            call.error = e
+            raise
+
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+
+            call.event.set()
+
+    async def do_async(self, key, func, *args, **kwargs):
+        """
+        Return `await func(*args, **kwargs)`, or the result of the
+        identical call with the same hashable `key` already awaited by
+        another task of the running loop.
+        The call runs in its own task, so it goes on for the other callers
+        if the one which started it is cancelled. It is cancelled once all
+        its callers are.
+        """
+        loop = asyncio.get_running_loop()
+        with self.__lock:
+            flight = self.__flights.get((loop, key))
+            leader = flight is None
+            if leader is True:
+                flight = self.__flights[(loop, key)] = _Flight(
+                    asyncio.ensure_future(func(*args, **kwargs))
+                )
+                flight.task.add_done_callback(
+                    functools.partial(self.__done, loop, key, flight)
+                )
+
+            flight.waiters += 1
+
+        self.__record(leader is False)
+        try:
+            result = await asyncio.shield(flight.task)
+
+        finally:
+            with self.__lock:
+                flight.waiters -= 1
+                abandoned = flight.waiters == 0 and flight.task.done() is False
+                if abandoned is True and self.__flights.get((loop, key)) is flight:
+                    # The next caller starts a new call.
+                    del self.__flights[(loop, key)]
+
+            if abandoned is True:
+                flight.task.cancel()
+
+        return result if leader is True else copy.deepcopy(result)
+
+    def __done(self, loop, key, flight, task):
+        with self.__lock:
+            if self.__flights.get((loop, key)) is flight:
+                del self.__flights[(loop, key)]
+
+        if task.cancelled() is False:
+            task.exception()  # Not an error if nobody was waiting anymore.
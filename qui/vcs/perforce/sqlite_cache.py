@@ -0,0 +1,112 @@
+"""
+    Persistent on-disk storage of the perforce query results.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+default_filename = os.path.join(
+    os.path.expanduser("~"), ".qui", "perforce_cache.sqlite"
+)
+
+
+class SQLiteCache(object):
+    """
+    SQLite (WAL mode) storage of cached results keyed by
+    server address + client + kind of query + path.
+    Each (server, client) pair is stamped with the change number its
+    results were valid at and with the client spec update date.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename or default_filename
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        os.makedirs(directory, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(
+            self.filename, check_same_thread=False
+        )
+        with self.__lock, self.__connection as c:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            c.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " server TEXT, client TEXT, kind TEXT, path TEXT, value TEXT,"
+                " PRIMARY KEY (server, client, kind, path))"
+            )
+            c.execute(
+                "CREATE TABLE IF NOT EXISTS stamps ("
+                " server TEXT, client TEXT, change INTEGER, client_update TEXT,"
+                " PRIMARY KEY (server, client))"
+            )
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def stamp(self, server, client):
+        """
+        Return the (change, client_update) stamp of `server` and `client`
+        results, (None, None) if nothing was saved.
+        """
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT change, client_update FROM stamps"
+                " WHERE server = ? AND client = ?",
+                (server, client)
+            ).fetchone()
+
+        return tuple(row) if row is not None else (None, None)
+
+    def load(self, server, client, kind):
+        """
+        Return a dict {path: value} of the `kind` results saved for
+        `server` and `client`.
+        """
+        with self.__lock:
+            rows = self.__connection.execute(
+                "SELECT path, value FROM entries"
+                " WHERE server = ? AND client = ? AND kind = ?",
+                (server, client, kind)
+            ).fetchall()
+
+        return {path: json.loads(value) for path, value in rows}
+
+    def save(self, server, client, results, change, client_update):
+        """
+        Replace the results saved for `server` and `client` by `results`,
+        a dict {kind: [(path, value)]}, and stamp them with `change`
+        and `client_update`.
+        """
+        with self.__lock, self.__connection as c:
+            c.execute(
+                "DELETE FROM entries WHERE server = ? AND client = ?",
+                (server, client)
+            )
+            for kind, items in results.items():
+                c.executemany(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (server, client, kind, path, json.dumps(value))
+                        for path, value in items
+                    ]
+                )
+
+            c.execute(
+                "INSERT OR REPLACE INTO stamps VALUES (?, ?, ?, ?)",
+                (server, client, change, client_update)
+            )
+
+    def clear(self, server=None, client=None):
+        """
+        Remove the results saved for `server` and `client`,
+        or everything if they are None.
+        """
+        where, params = "", ()
+        if server is not None and client is not None:
+            where, params = " WHERE server = ? AND client = ?", (server, client)
+
+        with self.__lock, self.__connection as c:
+            c.execute("DELETE FROM entries" + where, params)
+            c.execute("DELETE FROM stamps" + where, params)
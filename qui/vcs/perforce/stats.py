@@ -0,0 +1,134 @@
+"""
+    Perforce commands instrumentation.
+
+Example
+```python
+from qui.vcs.perforce import stats
+
+stats.enabled = True
+stats.track_callers = True  # to find who is hammering the server
+...
+print(stats.registry.dump_json())
+```
+"""
+import json
+import os
+import sys
+import threading
+
+enabled = False  # record the commands, connections and cache accesses
+track_callers = False  # also record the caller location of each command
+
+# Upper bounds (in seconds) of the latency histogram buckets.
+latency_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float('inf'))
+
+_package_directory = os.path.dirname(os.path.abspath(__file__))
+
+
+def _caller():
+    """
+    Return "filename:line" of the first frame outside of this package
+    and of the P4 module.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (frame.f_globals.get('__name__') != 'P4' and
+                not os.path.abspath(filename).startswith(_package_directory)):
+            return "{}:{}".format(filename, frame.f_lineno)
+
+        frame = frame.f_back
+
+    return None
+
+
+class Registry(object):
+    """
+    Thread safe aggregation of the perforce activity.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.__commands = {}
+            self.__caches = {}
+            self.__connections = {'new': 0, 'reused': 0}
+
+    def record_command(self, command, arg_count, latency, result_size):
+        """
+        Record a `command` run with `arg_count` arguments which took
+        `latency` seconds and returned `result_size` records.
+        """
+        caller = _caller() if track_callers is True else None
+        with self.__lock:
+            s = self.__commands.get(command)
+            if s is None:
+                s = self.__commands[command] = {
+                    'count': 0,
+                    'args': 0,
+                    'results': 0,
+                    'total_latency': 0.0,
+                    'max_latency': 0.0,
+                    'latency_histogram': [0] * len(latency_buckets),
+                    'callers': {},
+                }
+
+            s['count'] += 1
+            s['args'] += arg_count
+            s['results'] += result_size
+            s['total_latency'] += latency
+            s['max_latency'] = max(s['max_latency'], latency)
+            for i, bound in enumerate(latency_buckets):
+                if latency <= bound:
+                    s['latency_histogram'][i] += 1
+                    break
+
+            if caller is not None:
+                s['callers'][caller] = s['callers'].get(caller, 0) + 1
+
+    def record_cache(self, name, hit):
+        """
+        Record a hit (if `hit` is True) or a miss of the cache `name`.
+        """
+        with self.__lock:
+            s = self.__caches.setdefault(name, {'hits': 0, 'misses': 0})
+            s['hits' if hit is True else 'misses'] += 1
+
+    def record_connection(self, reused):
+        """
+        Record a connection reused from the pool or a new one.
+        """
+        with self.__lock:
+            self.__connections['reused' if reused is True else 'new'] += 1
+
+    def snapshot(self):
+        """
+        Return a dict copy of the recorded statistics.
+        """
+        with self.__lock:
+            return json.loads(json.dumps({
+                'commands': self.__commands,
+                'caches': self.__caches,
+                'connections': self.__connections,
+                'latency_buckets': [
+                    b if b != float('inf') else None for b in latency_buckets
+                ],
+            }))
+
+    def dump_json(self, filename=None):
+        """
+        Return the recorded statistics as a json string,
+        also written into `filename` if provided.
+        """
+        ret = json.dumps(self.snapshot(), indent=4, sort_keys=True)
+        if filename is not None:
+            with open(filename, 'w') as f:
+                f.write(ret)
+
+        return ret
+
+
+registry = Registry()
@@ -0,0 +1,170 @@
+"""
+    Background sync queue service.
+
+Example
+```python
+from qui.vcs.perforce import sync_queue
+
+queue = sync_queue.SyncQueue(parallel_threads=4)
+queue.progress.connect(progress_bar_slot)
+queue.batchFinished.connect(update_rows_slot)
+queue.enqueue(filenames)
+```
+"""
+import queue
+import threading
+import traceback
+
+from PySide6 import QtCore
+
+from P4 import (
+    OutputHandler,
+    P4,
+)
+
+from .. import perforce
+from . import server
+
+
+class _SyncOutputHandler(OutputHandler):
+    """
+    OutputHandler forwarding each synced file to `callback`.
+    """
+
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+
+    def outputStat(self, stat):
+        self.callback(stat)
+        return OutputHandler.HANDLED
+
+
+class SyncQueue(QtCore.QObject):
+    """
+    Sync the queued files from a worker thread, by batches of multi-file
+    `p4 sync` commands, and fetch their fstat records once each batch is
+    done, reporting everything through Qt signals.
+    """
+    fileSynced = QtCore.Signal(dict)  # p4 sync record of a synced file
+    progress = QtCore.Signal(int, int)  # processed files, queued files
+    batchFinished = QtCore.Signal(list)  # perforce.FileStat records of a batch
+    failed = QtCore.Signal(str)  # error message
+
+    def __init__(self, force=True, parallel_threads=0, batch_size=200,
+                 batch_delay=0.1, fields=perforce.asset_tree_fstat_fields,
+                 env=None, parent=None):
+        """
+        `force` adds the -f option to the syncs.
+        `parallel_threads` uses `p4 sync --parallel` if greater than 1.
+        A batch holds up to `batch_size` files queued within `batch_delay`
+        seconds.
+        `fields` are the fstat fields fetched after each batch (all of them
+        if None).
+        `env` is passed to server.connect (see its documentation).
+        """
+        super(SyncQueue, self).__init__(parent=parent)
+        self.force = force
+        self.parallel_threads = parallel_threads
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.fields = fields
+        self.env = env
+        self.__queue = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__queued = 0
+        self.__processed = 0
+        self.__thread = None
+
+    def enqueue(self, filenames):
+        """
+        Queue `filenames` to be synced, starting the worker if needed.
+        """
+        with self.__lock:
+            for f in filenames:
+                self.__queue.put(f)
+
+            self.__queued += len(filenames)
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = threading.Thread(
+                    target=self.__run, name="qui-p4-sync", daemon=True
+                )
+                self.__thread.start()
+
+    def __next_batch(self):
+        try:
+            batch = [self.__queue.get(timeout=1.0)]
+
+        except queue.Empty:
+            return []
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.__queue.get(timeout=self.batch_delay))
+
+            except queue.Empty:
+                break
+
+        return batch
+
+    def __run(self):
+        while True:
+            with self.__lock:
+                if self.__queue.empty() and self.__processed >= self.__queued:
+                    # Nothing left, a new worker is started by `enqueue`.
+                    self.__thread = None
+                    return
+
+            batch = self.__next_batch()
+            if batch == []:
+                continue
+
+            try:
+                self.sync(batch)
+
+            except Exception as e:
+                traceback.print_exc()
+                self.failed.emit(str(e))
+
+            finally:
+                with self.__lock:
+                    self.__processed += len(batch)
+                    processed, queued = self.__processed, self.__queued
+
+                self.progress.emit(processed, queued)
+
+    def _file_synced(self, stat):
+        self.fileSynced.emit(stat)
+        with self.__lock:
+            self.__processed_in_batch += 1
+            processed = self.__processed + self.__processed_in_batch
+            queued = self.__queued
+
+        self.progress.emit(processed, queued)
+
+    def sync(self, filenames):
+        """
+        Sync `filenames` with a single command, emit the signals and
+        return the list of their FileStat records.
+        """
+        args = ['sync']
+        if self.force is True:
+            args.append('-f')
+
+        if self.parallel_threads > 1:
+            args.append('--parallel=threads={}'.format(self.parallel_threads))
+
+        self.__processed_in_batch = 0
+        with server.connect(env=self.env) as p4_adapter:
+            with p4_adapter.at_exception_level(P4.RAISE_ERROR):
+                with p4_adapter.using_handler(_SyncOutputHandler(self._file_synced)):
+                    for batch in perforce.iter_batches(filenames):
+                        p4_adapter.run(*args, batch)
+
+            records = list(perforce.iter_fstat(
+                filenames, fields=self.fields, compact=True,
+                p4_adapter=p4_adapter
+            ))
+
+        self.batchFinished.emit(records)
+        return records
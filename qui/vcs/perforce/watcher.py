@@ -0,0 +1,132 @@
+"""
+    Changelist watcher service.
+
+Example
+```python
+from qui.vcs.perforce import watcher
+
+changelist_watcher = watcher.ChangelistWatcher(interval=5.0)
+changelist_watcher.changelistSubmitted.connect(asset_tree_widget.changelistSlot)
+changelist_watcher.start()
+```
+"""
+import threading
+import traceback
+
+from PySide6 import QtCore
+
+from P4 import P4
+
+from .. import perforce
+from . import server
+
+
+class ChangelistWatcher(QtCore.QObject):
+    """
+    Poll the server change counter from a background thread and, when it
+    moves, fetch only the new changelists and their files.
+    Changelists are emitted as dicts such as returned by `p4 changes` with
+    an additional 'files' key holding the list of the affected depot files.
+    """
+    changeCounterMoved = QtCore.Signal(int)
+    changelistSubmitted = QtCore.Signal(dict)
+    changelistCreated = QtCore.Signal(dict)
+
+    def __init__(self, interval=5.0, path=None, invalidate_caches=True,
+                 env=None, parent=None):
+        """
+        `interval` is the number of seconds between two polls.
+        `path` restricts the watched changelists to a perforce path
+        (ie. "//depot/project/..."), all of them are watched if None.
+        If `invalidate_caches` is True, the perforce cached results of the
+        files of the submitted changelists are invalidated.
+        `env` is passed to server.connect (see its documentation).
+        """
+        super(ChangelistWatcher, self).__init__(parent=parent)
+        self.interval = interval
+        self.path = path
+        self.invalidate_caches = invalidate_caches
+        self.env = env
+        self.last_change = None
+        self.__stop_event = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(
+            target=self.__run, name="qui-p4-watcher", daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self, wait=True):
+        self.__stop_event.set()
+        if wait is True and self.__thread is not None:
+            self.__thread.join()
+
+    def __run(self):
+        while self.__stop_event.is_set() is False:
+            try:
+                self.poll()
+
+            except Exception:
+                traceback.print_exc()
+
+            self.__stop_event.wait(self.interval)
+
+    def poll(self, p4_adapter=None):
+        """
+        Emit the events of the changelists created since the last poll.
+        The first poll only records the current change counter.
+        Return the list of the new changelist dicts.
+        """
+        with server.connect(env=self.env, p4_adapter=p4_adapter) as p4_adapter:
+            change = perforce.get_latest_change(p4_adapter=p4_adapter)
+            if self.last_change is None or change <= self.last_change:
+                self.last_change = change
+                return []
+
+            changelists = []
+            with p4_adapter.at_exception_level(P4.RAISE_NONE):
+                for status in ('submitted', 'pending'):
+                    args = ['changes', '-l', '-s', status,
+                            '-e', str(self.last_change + 1)]
+                    if self.path is not None:
+                        args.append(self.path)
+
+                    for c in p4_adapter.run(*args):
+                        c.setdefault('status', status)
+                        changelists.append(c)
+
+                # A single `p4 describe` for all the new changelists.
+                described = {
+                    d['change']: d.get('depotFile', [])
+                    for d in perforce.run_batched(
+                        p4_adapter, 'describe',
+                        [c['change'] for c in changelists], args=('-s',)
+                    )
+                } if changelists != [] else {}
+                for c in changelists:
+                    c['files'] = described.get(c['change'], [])
+
+        self.last_change = change
+        self.changeCounterMoved.emit(change)
+        submitted_files = []
+        for c in sorted(changelists, key=lambda x: int(x['change'])):
+            if c['status'] == 'submitted':
+                submitted_files += c['files']
+                self.changelistSubmitted.emit(c)
+
+            else:
+                self.changelistCreated.emit(c)
+
+        if self.invalidate_caches is True:
+            if self.path is None:
+                perforce.acknowledge_change(change, paths=submitted_files, env=self.env)
+
+            else:
+                perforce.invalidate_paths(submitted_files, where=False)
+
+        return changelists